@@ -2,8 +2,10 @@ import sys
 import os
 import mimetypes
 from flask import Flask, render_template
-from services.database import save_public_db # 確保 database 初始化邏輯被執行
+from services.database import save_public_db # 儲存後端 (STORAGE_BACKEND=firebase / sqlite) 於第一次讀寫時初始化
 from routes import api_bp 
+from services.jobs import job_runner
+from services.refresh import run_refresh
 
 # 強制告訴 Python .js 檔案就是 application/javascript
 # 這行能解決 "MIME type of text/plain" 的錯誤
@@ -17,6 +19,13 @@ app = Flask(__name__)
 # 註冊 API 路由 (來自 routes.py)
 app.register_blueprint(api_bp)
 
+# 定期自動更新 (REFRESH_INTERVAL 秒，0 = 關閉)
+# 多個 worker 時由檔案鎖決定誰排程；debug 模式的 reloader 主 process 不處理請求，不排程
+REFRESH_INTERVAL = int(os.environ.get("REFRESH_INTERVAL", "0"))
+_reloader_parent = __name__ == '__main__' and os.environ.get("WERKZEUG_RUN_MAIN") != "true"
+if REFRESH_INTERVAL > 0 and not _reloader_parent:
+    job_runner.schedule("refresh", run_refresh, REFRESH_INTERVAL)
+
 # 首頁路由
 @app.route('/')
 def index():
@@ -0,0 +1,111 @@
+"""
+解析器效能比較：python -m benchmarks.bench_parser [--html-dir DIR] [--processes N]
+
+沒有指定 --html-dir 時，會用 backup/chiikawa_public_db_backup.json 產生與目錄頁相同結構的 HTML。
+"""
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+import concurrent.futures
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.parser import parse_page, PARSER_BACKENDS, HAS_LXML, DOMAIN
+
+BACKUP_PATH = os.path.join("backup", "chiikawa_public_db_backup.json")
+ITEMS_PER_PAGE = 50
+
+def build_fixture_pages(items, per_page=ITEMS_PER_PAGE):
+    """模擬目錄頁：導覽列、側欄等雜訊 + a.lightbox 商品連結"""
+    pages = []
+    filler = "".join(f'<li><a href="/contents/NOD{n}/">分類 {n}</a></li>' for n in range(80))
+    for start in range(0, len(items), per_page):
+        links = []
+        for i in items[start:start + per_page]:
+            src = i["image"].replace(DOMAIN, "")
+            links.append(
+                f'<div class="item"><a class="lightbox" href="{src}" title="{i["name"]}">'
+                f'<img src="{src.replace("_b.png", "_s.png")}" alt="{i["name"]}"></a>'
+                f'<p class="caption">{i["name"]}</p></div>'
+            )
+        html = (
+            '<!DOCTYPE html><html><head><meta charset="utf-8"><title>NOD62</title>'
+            '<script>var x = "<a class=lightbox>";</script></head><body>'
+            f'<nav><ul>{filler}</ul></nav><main>{"".join(links)}</main>'
+            f'<aside><ul>{filler}</ul></aside></body></html>'
+        )
+        pages.append(html.encode("utf-8"))
+    return pages
+
+def load_pages(html_dir):
+    pages = []
+    for path in sorted(glob.glob(os.path.join(html_dir, "**", "*.html"), recursive=True)):
+        with open(path, "rb") as f:
+            pages.append(f.read())
+    return pages
+
+def bench(backend, pages, repeat, processes=0):
+    total_items = 0
+    pool = concurrent.futures.ProcessPoolExecutor(max_workers=processes) if processes else None
+    if pool:
+        list(pool.map(abs, range(processes * 4)))  # 先把 worker 啟動，不計入時間
+    start = time.perf_counter()
+    for _ in range(repeat):
+        if pool:
+            results = list(pool.map(parse_page, pages, [DOMAIN] * len(pages), [backend] * len(pages)))
+        else:
+            results = [parse_page(p, DOMAIN, backend) for p in pages]
+        total_items += sum(len(r) for r in results)
+    elapsed = time.perf_counter() - start
+    if pool:
+        pool.shutdown()
+    total_bytes = sum(len(p) for p in pages) * repeat
+    return {
+        "backend": backend,
+        "processes": processes,
+        "pages_per_sec": round(len(pages) * repeat / elapsed, 1),
+        "items_per_sec": round(total_items / elapsed, 1),
+        "mb_per_sec": round(total_bytes / elapsed / 1e6, 2),
+        "seconds": round(elapsed, 3),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Parse throughput per backend")
+    parser.add_argument("--html-dir", help="資料夾內的 *.html (例如存下來的 PGE 頁面)")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--processes", type=int, default=0, help="另外測 process pool 版本")
+    parser.add_argument("--json", action="store_true", help="以 JSON 輸出結果")
+    args = parser.parse_args()
+
+    if args.html_dir:
+        pages = load_pages(args.html_dir)
+    else:
+        with open(BACKUP_PATH, "r", encoding="utf-8") as f:
+            pages = build_fixture_pages(json.load(f))
+    if not pages:
+        sys.exit("No HTML pages found")
+
+    # 各 backend 結果必須一致
+    reference = [parse_page(p, DOMAIN, "bs4") for p in pages]
+    backends = [b for b in PARSER_BACKENDS if b != "lxml" or HAS_LXML]
+    for backend in backends:
+        if [parse_page(p, DOMAIN, backend) for p in pages] != reference:
+            print(f"⚠️ {backend} 的解析結果與 bs4 不同")
+
+    results = [bench(b, pages, args.repeat) for b in backends]
+    if args.processes:
+        results += [bench(b, pages, args.repeat, args.processes) for b in backends]
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{len(pages)} pages x {args.repeat}")
+    for r in results:
+        label = f"{r['backend']} (x{r['processes']} proc)" if r["processes"] else r["backend"]
+        print(f"{label:<18} {r['pages_per_sec']:>9} pages/s {r['items_per_sec']:>10} items/s {r['mb_per_sec']:>7} MB/s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+"""
+更新流程各階段的效能測試：python -m benchmarks.bench_pipeline [--sizes 1000,10000,100000] [--output results.json]
+
+以 backup/chiikawa_public_db_backup.json 與關鍵字表產生假目錄，分別量測：
+  classify    名稱 -> 地區 / 景點 / 類別 (classify_batch)
+  region      apply_region_logic
+  coords      CoordinatePlacer 座標配置
+  merge       merge_crawled_items (爬蟲結果 + existing_map 合併，含分類與座標)
+  fix_regions fix_item_region + rules_fingerprint (第一次全算 / 第二次指紋全命中)
+  diff        儲存時的差異計算 (diff_items / diff_catalog)
+  serialize   目錄快取序列化 (JSON + gzip) 與 Flask jsonify
+結果 (每秒筆數、峰值記憶體) 以 JSON 輸出，--compare 可與之前的結果比較。
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services import location
+from services.location import (apply_region_logic, classify_batch, CoordinatePlacer, rules_fingerprint,
+                               region_rules_digest, REGION_COORDS, REGION_KEYWORDS, SPOT_COORDS)
+from services.refresh import merge_crawled_items, fix_item_region
+from services.storage import diff_items
+from services.changes import diff_catalog
+from services.cache import CatalogSnapshot
+
+BACKUP_PATH = os.path.join("backup", "chiikawa_public_db_backup.json")
+DEFAULT_SIZES = [1000, 10000, 100000]
+NEW_ITEM_RATIO = 0.02    # 每次更新新出現的商品比例
+
+# --- 假資料 ---
+def load_seed(path=BACKUP_PATH):
+    with open(path, "r", encoding="utf-8") as f:
+        items = json.load(f)
+    motifs, products = set(), set()
+    for item in items:
+        head, _, tail = item['name'].partition("　")
+        motifs.add(head)
+        if tail: products.add(tail)
+    motifs |= {k for kws in REGION_KEYWORDS.values() for k in kws} | set(SPOT_COORDS)
+    locations = [i['search_location'] for i in items if i.get('search_location')]
+    return sorted(motifs), sorted(products) or ["ポーチ"], locations
+
+def make_catalog(size, seed, rng):
+    """回傳 (上次的目錄, 這次爬到的商品)"""
+    motifs, products, locations = seed
+    crawled, old_items = [], []
+    for n in range(size):
+        name = f"{rng.choice(motifs)}　{rng.choice(products)}"
+        if rng.random() < 0.05:
+            name = f"{rng.choice(motifs)}{rng.choice(motifs)}　{rng.choice(products)}"
+        image = f"https://www.jp-api.com/images/tphoto_{1000000 - n}_0_b.png"
+        crawled.append({"name": name, "image": image, "region": "其他", "category": "other"})
+        if rng.random() >= NEW_ITEM_RATIO:
+            loc = rng.choice(locations) if rng.random() < 0.7 else ""
+            base = REGION_COORDS[rng.choice(list(REGION_COORDS))]
+            old_items.append({
+                "id": n + 1, "name": name, "image": image, "category": "other", "emoji": "✨",
+                "region": "其他", "search_location": loc,
+                "lat": base['lat'] + rng.uniform(-0.1, 0.1), "lng": base['lng'] + rng.uniform(-0.1, 0.1),
+            })
+    return old_items, crawled
+
+# --- 量測 ---
+def measure(func, memory):
+    start = time.perf_counter()
+    func()
+    seconds = time.perf_counter() - start
+    peak = None
+    if memory:
+        # 記憶體另外跑一次 (tracemalloc 會拖慢速度，不計入時間)
+        tracemalloc.start()
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return seconds, peak
+
+def run_size(size, seed, memory, rng):
+    old_items, crawled = make_catalog(size, seed, rng)
+    names = [i['name'] for i in crawled]
+    merged = merge_crawled_items(crawled, old_items)
+    changed = [dict(i) for i in merged]
+    for item in rng.sample(changed, max(1, size // 100)):
+        item['region'] = "近畿"
+
+    def fix_all(items):
+        # 與 /api/fix_regions 相同：每批只取一次關鍵字表版本
+        digest = region_rules_digest()
+        checked = 0
+        for item in items:
+            if item.get('rules_fp') == rules_fingerprint(item, digest=digest): continue
+            checked += 1
+            fix_item_region(item)
+            item['rules_fp'] = rules_fingerprint(item, digest=digest)
+        return checked
+
+    # 實際流程：修正一次後再跑一次更新 (合併)，warm 量的是更新之後的修正
+    fixed = [dict(i) for i in merged]
+    fix_all(fixed)
+    refreshed = merge_crawled_items(crawled, fixed)
+    rechecked = fix_all([dict(i) for i in refreshed])
+    print(f"{size:>9} fix_regions_warm re-checks {rechecked} items after a refresh", file=sys.stderr)
+
+    def jsonify_catalog():
+        from flask import Flask, jsonify
+        with Flask(__name__).app_context():
+            jsonify(merged).get_data()
+
+    def place_all():
+        placer = CoordinatePlacer()
+        for item in crawled:
+            spot = location.classify_name(item['name'])['spot']
+            anchor = SPOT_COORDS[spot] if spot else REGION_COORDS["其他"]
+            placer.add(item['image'], anchor['lat'], anchor['lng'], 0.005 if spot else 0.15)
+        placer.place_all()
+
+    stages = {
+        "classify": lambda: classify_batch(names),
+        "region": lambda: [apply_region_logic(i) for i in old_items],
+        "coords": place_all,
+        "merge": lambda: merge_crawled_items(crawled, old_items),
+        "fix_regions_cold": lambda: fix_all([dict(i) for i in merged]),
+        "fix_regions_warm": lambda: fix_all([dict(i) for i in refreshed]),
+        "diff_items": lambda: diff_items(merged, changed),
+        "diff_catalog": lambda: diff_catalog(merged, changed),
+        "serialize": lambda: CatalogSnapshot(merged, 1),
+        "jsonify": jsonify_catalog,
+    }
+    results = []
+    for stage, func in stages.items():
+        seconds, peak = measure(func, memory)
+        results.append({
+            "stage": stage,
+            "items": size,
+            "seconds": round(seconds, 4),
+            "items_per_sec": round(size / seconds, 1) if seconds else None,
+            "peak_memory_bytes": peak,
+        })
+        print(f"{size:>9} {stage:<18} {seconds:>9.4f}s {size / seconds if seconds else 0:>12.0f} items/s"
+              + (f" {peak / 1e6:>9.1f} MB" if peak is not None else ""), file=sys.stderr)
+    return results
+
+def compare(results, baseline_path):
+    """與之前的結果比較，回傳變慢超過 10% 的階段"""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = {(r["stage"], r["items"]): r for r in json.load(f)["results"]}
+    regressions = []
+    for r in results:
+        old = baseline.get((r["stage"], r["items"]))
+        if not old or not old["items_per_sec"] or not r["items_per_sec"]: continue
+        ratio = r["items_per_sec"] / old["items_per_sec"]
+        print(f"{r['items']:>9} {r['stage']:<18} x{ratio:.2f}", file=sys.stderr)
+        if ratio < 0.9:
+            regressions.append({**r, "baseline_items_per_sec": old["items_per_sec"], "ratio": round(ratio, 3)})
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Refresh / classify / serialize pipeline benchmark")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)),
+                        help="目錄大小 (逗號分隔，最大可到 1000000)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--no-memory", action="store_true", help="不量測峰值記憶體 (比較快)")
+    parser.add_argument("--output", help="結果寫入 JSON 檔")
+    parser.add_argument("--compare", help="與之前的結果 JSON 比較")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    seed = load_seed()
+    results = []
+    for size in (int(s) for s in args.sizes.split(",") if s):
+        results += run_size(size, seed, not args.no_memory, rng)
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "seed": args.seed,
+        "results": results,
+    }
+    if args.compare:
+        report["regressions"] = compare(results, args.compare)
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+    if report.get("regressions"):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
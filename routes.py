@@ -1,143 +1,295 @@
-from flask import Blueprint, jsonify, request
-from services.database import load_public_db, save_public_db
-from services.crawler import run_crawler
-# 引用新的 LOCATION_CORRECTIONS
-from services.location import apply_region_logic, SPOT_COORDS, REGION_COORDS, LOCATION_CORRECTIONS 
-import random
+import os
+import json
+import time
+import functools
+from flask import Blueprint, jsonify, request, Response, stream_with_context, send_file, g
+from services.database import (load_public_db, save_public_db, import_public_db, get_catalog_snapshot,
+                               get_catalog_changes, get_geo_index)
+from services.changes import change_log
+from services.importer import (ImportFormatError, iter_json_array, iter_ndjson, spool_upload,
+                               validate_stream, iter_valid_chunks)
+from services.catalog_index import (REGIONS, CATEGORIES, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE,
+                                    encode_cursor, decode_cursor, paginate, project, parse_bbox)
+from services.refresh import run_refresh
+from services.jobs import job_runner
+from services.geocode import build_corrections
+from services.refresh import fix_item_region, FIX_FIELDS
+from services.location import rules_fingerprint, region_rules_digest
+from services.storage import item_key
+from services.images import image_cache, THUMBNAIL_SIZES
+from services.metrics import registry, HTTP_REQUEST_SECONDS
 
 api_bp = Blueprint('api', __name__)
 
+FILTER_PARAMS = ("region", "category", "ids", "bbox", "fields", "cursor", "limit")
+IMAGE_MAX_AGE = 24 * 3600   # /img/<key> 的網址不含內容 hash，過期後用 ETag 重新確認
+STREAM_HEARTBEAT = 15   # SSE 沒有變動時每 15 秒送一次心跳
+# 每個 SSE 連線會佔住一個 worker (gunicorn sync worker 尤其明顯)：可以整個關掉，
+# 開著時每條連線最多保持 STREAM_MAX_LIFETIME 秒，之後由 EventSource 帶 Last-Event-ID 自動重連
+STREAM_ENABLED = os.environ.get("ENABLE_EVENT_STREAM", "1") != "0"
+STREAM_MAX_LIFETIME = int(os.environ.get("STREAM_MAX_LIFETIME", "300"))
+STREAM_RETRY_MS = 3000
+
+# --- 請求延遲 (所有路由，依路由樣板分組，/img/<key> 不會因為 key 不同而分散) ---
+@api_bp.before_app_request
+def _start_timer():
+    g.request_start = time.perf_counter()
+
+@api_bp.after_app_request
+def _record_latency(response):
+    start = g.pop("request_start", None)
+    if start is not None:
+        endpoint = request.url_rule.rule if request.url_rule else "<unmatched>"
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint=endpoint,
+                                     method=request.method, status=response.status_code)
+    return response
+
+@api_bp.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus 格式的指標 (只在被讀取時才組出內容)"""
+    return Response(registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
 # --- 1. 讀取公有商品資料 ---
 @api_bp.route('/api/public_items', methods=['GET'])
 def get_public_items():
-    items = load_public_db()
-    return jsonify(items)
+    # 直接回傳預先序列化好的 JSON，客戶端已有最新版本時回 304
+    snapshot = get_catalog_snapshot()
+    if any(p in request.args for p in FILTER_PARAMS):
+        return query_public_items(snapshot)
+
+    headers = {"Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    body, encoding = snapshot.body, None
+    for candidate in ("br", "gzip"):
+        if candidate in snapshot.encoded and candidate in request.accept_encodings:
+            body, encoding = snapshot.encoded[candidate], candidate
+            headers["Content-Encoding"] = encoding
+            break
+    headers["ETag"] = f'"{snapshot.etag_for(encoding)}"'
+
+    # 客戶端手上是這一版的任何一種編碼都算最新
+    if any(etag in request.if_none_match for etag in snapshot.etags):
+        headers.pop("Content-Encoding", None)
+        return Response(status=304, headers=headers)
+    return Response(body, mimetype="application/json", headers=headers)
+
+# --- 目錄變動 (客戶端已有舊版本時只下載差異) ---
+def _changes_payload(since):
+    snapshot = get_catalog_snapshot()
+    changes = get_catalog_changes(since)
+    if changes is None:
+        # 版本太舊或未知：請客戶端重新下載 /api/public_items
+        return {"version": snapshot.version, "reset": True}
+    return {"version": snapshot.version, "reset": False, **changes}
+
+@api_bp.route('/api/public_items/changes', methods=['GET'])
+def public_items_changes():
+    """?since=<version> -> {"version", "reset", "added", "updated", "removed"}"""
+    try:
+        since = int(request.args["since"])
+    except (KeyError, ValueError):
+        return jsonify({"status": "error", "message": "since must be an integer version"}), 400
+    return jsonify(_changes_payload(since))
+
+@api_bp.route('/api/public_items/stream', methods=['GET'])
+def public_items_stream():
+    """Server-Sent Events：每次目錄版本更新時推送 changes 事件 (內容同 /api/public_items/changes)"""
+    if not STREAM_ENABLED:
+        return jsonify({"status": "error", "message": "Event stream is disabled, poll /api/public_items/changes"}), 404
+    # 重連時瀏覽器會帶上最後收到的 id，優先於網址上的 ?since=
+    since = request.headers.get("Last-Event-ID", type=int)
+    if since is None:
+        since = request.args.get("since", type=int)
+    if since is None:
+        since = get_catalog_snapshot().version
+
+    def generate():
+        version = since
+        deadline = time.monotonic() + STREAM_MAX_LIFETIME
+        yield f"retry: {STREAM_RETRY_MS}\n\n"
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return   # 連線到期，讓客戶端重連，釋放 worker
+            current = change_log.wait(version, min(STREAM_HEARTBEAT, remaining))
+            if current is None or current == version:
+                yield ": heartbeat\n\n"
+                continue
+            payload = _changes_payload(version)
+            version = payload["version"]
+            yield f"id: {version}\nevent: changes\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return Response(stream_with_context(generate()), mimetype="text/event-stream", headers=headers)
+
+def query_public_items(snapshot):
+    """
+    伺服器端篩選：?region=近畿&category=tag&ids=1,2&bbox=南,西,北,東&fields=id,name&limit=50&cursor=...
+    回傳 {"items", "next_cursor", "total", "version"}
+    """
+    args = request.args
+    region = args.get("region") or None
+    category = args.get("category") or None
+    if region is not None and region not in REGIONS:
+        return jsonify({"status": "error", "message": f"Unknown region: {region}"}), 400
+    if category is not None and category not in CATEGORIES:
+        return jsonify({"status": "error", "message": f"Unknown category: {category}"}), 400
+
+    ids = [i for i in args.get("ids", "").split(",") if i] or None
+    fields = [f for f in args.get("fields", "").split(",") if f] or None
+    try:
+        bbox = parse_bbox(args["bbox"]) if args.get("bbox") else None
+        limit = min(max(int(args.get("limit", DEFAULT_PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+        cursor_version, after = decode_cursor(args["cursor"]) if args.get("cursor") else (snapshot.version, -1)
+    except (ValueError, UnicodeDecodeError) as e:
+        return jsonify({"status": "error", "message": f"Bad query: {e}"}), 400
+    if cursor_version != snapshot.version:
+        # 翻頁途中目錄更新過，位置已經變了：請客戶端從第一頁重新開始
+        return jsonify({"status": "error", "message": "Catalog changed since this cursor was issued",
+                        "version": snapshot.version, "reset": True}), 410
+
+    positions = snapshot.index.query(region=region, category=category, ids=ids, bbox=bbox)
+    page, has_more = paginate(positions, after, limit)
+    items = snapshot.items
+    return jsonify({
+        "items": [project(items[p], fields) for p in page],
+        "next_cursor": encode_cursor(snapshot.version, page[-1]) if has_more else None,
+        "total": len(positions),
+        "version": snapshot.version,
+    })
+
+# --- 地圖群集 (依縮放等級與視窗在伺服器端分群) ---
+@api_bp.route('/api/map_clusters', methods=['GET'])
+def map_clusters():
+    """?zoom=7&bbox=南,西,北,東&region=近畿&category=tag"""
+    args = request.args
+    region = args.get("region") or None
+    category = args.get("category") or None
+    if region is not None and region not in REGIONS:
+        return jsonify({"status": "error", "message": f"Unknown region: {region}"}), 400
+    if category is not None and category not in CATEGORIES:
+        return jsonify({"status": "error", "message": f"Unknown category: {category}"}), 400
+    try:
+        zoom = int(args.get("zoom", 5))
+        bbox = parse_bbox(args["bbox"]) if args.get("bbox") else None
+    except ValueError as e:
+        return jsonify({"status": "error", "message": f"Bad query: {e}"}), 400
 
-# --- 2. 管理員更新商品 (爬蟲 -> Firebase) ---
+    index, snapshot = get_geo_index()
+    clusters = index.clusters(zoom, bbox=bbox, region=region, category=category)
+    return jsonify({"zoom": zoom, "version": snapshot.version, "clusters": clusters})
+
+# --- 2. 管理員更新商品 (爬蟲 -> Firebase，背景執行) ---
 @api_bp.route('/api/refresh', methods=['POST'])
 def refresh_data():
-    old_items = load_public_db()
-    existing_map = {}
-    if old_items:
-        for i in old_items:
-            key = i.get('image', '').split('/')[-1] or i.get('name')
-            existing_map[key] = i
-    
-    crawled_items = run_crawler()
-    updated_list = []
-    
-    for idx, c_item in enumerate(crawled_items):
-        final_item = c_item.copy()
-        final_item['id'] = idx + 1
-        
-        key = final_item.get('image', '').split('/')[-1] or final_item['name']
-        has_manual_location = False
-        
-        # 檢查是否有手動修正表對應
-        loc = final_item.get('search_location', '')
-        if not loc and key in existing_map:
-             # 繼承舊資料的 search_location
-             loc = existing_map[key].get('search_location', '')
-             final_item['search_location'] = loc
-
-        if loc and loc in LOCATION_CORRECTIONS:
-            # 🔥 強制修正：使用對照表的座標和地區
-            correct = LOCATION_CORRECTIONS[loc]
-            final_item['lat'] = correct['lat']
-            final_item['lng'] = correct['lng']
-            final_item['region'] = correct['region']
-            has_manual_location = True
-
-        # 如果沒有強制修正，嘗試繼承舊資料
-        if not has_manual_location and key in existing_map:
-            old_item = existing_map[key]
-            if 'search_location' in old_item and old_item['search_location']:
-                final_item['lat'] = old_item['lat']
-                final_item['lng'] = old_item['lng']
-                final_item['search_location'] = old_item['search_location']
-                final_item['region'] = old_item.get('region', final_item['region'])
-                has_manual_location = True
-
-        # 自動定位 (最後手段)
-        if not has_manual_location:
-            final_item['region'] = apply_region_logic(final_item)
-            
-            target_lat = None
-            target_lng = None
-            spread = 0.15 
-            
-            for spot_key, coords in SPOT_COORDS.items():
-                if spot_key in final_item['name']:
-                    target_lat = coords['lat']
-                    target_lng = coords['lng']
-                    spread = 0.005
-                    break
-            
-            if target_lat is None:
-                base_coord = REGION_COORDS.get(final_item['region'], REGION_COORDS["其他"])
-                target_lat = base_coord['lat']
-                target_lng = base_coord['lng']
-
-            final_item['lat'] = target_lat + (random.random() - 0.5) * spread
-            final_item['lng'] = target_lng + (random.random() - 0.5) * spread
-        
-        if final_item['category'] == 'plush': final_item['emoji'] = "🧸"
-        elif final_item['category'] == 'tag': final_item['emoji'] = "🏷️"
-        elif final_item['category'] == 'socks': final_item['emoji'] = "🧦"
-        else: final_item['emoji'] = "✨"
-        
-        updated_list.append(final_item)
-    
-    save_public_db(updated_list)
-    return jsonify({"status": "success", "total": len(updated_list)})
+    # ?sync=1 時等工作跑完才回傳 (給 script 用)，否則立刻回傳 job id；兩者都經過 job_runner，同時只會有一個更新在跑
+    # ?full=1 強制完整爬取 (下架商品、規則改變後的類別都會重新確認)
+    full = True if request.args.get("full") else None
+    job, created = job_runner.submit("refresh", functools.partial(run_refresh, full=full))
+    if created and request.args.get("sync"):
+        job.wait()
+        if job.status == "failed":
+            return jsonify({"status": "error", "message": job.error, "job": job.to_dict()}), 500
+        return jsonify({"status": "success", "total": job.result["total"], "job": job.to_dict()})
+
+    body = {"status": "accepted" if created else "running", "job": job.to_dict()}
+    return jsonify(body), 202 if created else 409
+
+@api_bp.route('/api/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = job_runner.get(job_id)
+    if job is None:
+        return jsonify({"status": "error", "message": "Job not found"}), 404
+    return jsonify({"status": "success", "job": job.to_dict()})
 
-# --- 3. 修正地區 (大幅升級：連座標一起修) ---
+# --- 3. 修正地區 (大幅升級：連座標一起修，只處理規則或輸入有變的商品) ---
 @api_bp.route('/api/fix_regions', methods=['POST'])
 def fix_regions():
     items = load_public_db()
     updated_count = 0
+    checked_count = 0
+    patch = []
+    # 只用地理編碼快取：線上查詢可能要花上數十秒，交給背景的 /api/refresh
+    corrections = build_corrections(items, cache_only=True)
+    digest = region_rules_digest()
     
     for item in items:
-        loc = item.get('search_location', '').strip()
-        
-        # 1. 強制修正 (查表)
-        if loc and loc in LOCATION_CORRECTIONS:
-            correct = LOCATION_CORRECTIONS[loc]
-            # 檢查是否需要更新
-            if (item.get('region') != correct['region'] or 
-                abs(item.get('lat', 0) - correct['lat']) > 0.0001 or 
-                abs(item.get('lng', 0) - correct['lng']) > 0.0001):
-                
-                item['lat'] = correct['lat']
-                item['lng'] = correct['lng']
-                item['region'] = correct['region']
-                updated_count += 1
-            continue 
-
-        # 2. 自動判斷 (舊邏輯)
-        old_region = item.get('region')
-        
-        # 優化：如果已經是有效地區，就跳過
-        if old_region and old_region != "其他":
-             continue
-
-        new_region = apply_region_logic(item)
-        if new_region and new_region != old_region:
-            item['region'] = new_region
+        if not isinstance(item, dict): continue
+        # 上次判斷時的規則 / 輸入 / 結果都沒變，就不用再算一次
+        if item.get('rules_fp') == rules_fingerprint(item, corrections, digest): continue
+
+        checked_count += 1
+        before = {f: item.get(f) for f in FIX_FIELDS}
+        if fix_item_region(item, corrections):
             updated_count += 1
+        item['rules_fp'] = rules_fingerprint(item, corrections, digest)
+
+        changed = {f: item.get(f) for f in FIX_FIELDS if item.get(f) != before[f]}
+        if changed:
+            patch.append({"id": item.get('id'), "key": item_key(item), "fields": changed})
             
     save_public_db(items)
     
-    # 🔥 關鍵修正：直接回傳最新的 items 資料
-    return jsonify({"status": "success", "data": items, "updated": updated_count})
+    # 🔥 只回傳有變動的商品欄位，前端自行套用
+    return jsonify({"status": "success", "patch": patch, "updated": updated_count, "checked": checked_count})
 
-# --- 4. 管理員匯入 ---
+# --- 4. 管理員匯入 (串流解析 + 逐筆驗證 + 分批寫入) ---
 @api_bp.route('/api/import_public_data', methods=['POST'])
 def import_public_data():
+    """
+    上傳 JSON 陣列或 NDJSON (Content-Type: application/x-ndjson 或 ?format=ndjson)。
+    ?dry_run=1 只驗證不寫入；預設有任何不合法的商品就整批拒絕，?skip_invalid=1 則略過它們。
+    """
+    dry_run = bool(request.args.get("dry_run"))
+    skip_invalid = bool(request.args.get("skip_invalid"))
+    ndjson = request.args.get("format") == "ndjson" or request.mimetype == "application/x-ndjson"
+    parse = iter_ndjson if ndjson else iter_json_array
+
     try:
-        new_items = request.json
-        if not isinstance(new_items, list): return jsonify({"status": "error"}), 400
-        save_public_db(new_items)
-        return jsonify({"status": "success", "message": "Public DB updated"})
+        with spool_upload(request.stream) as upload:
+            # 第一遍：驗證 (不把整份載入記憶體)
+            total, invalid, errors = validate_stream(parse(upload))
+            result = {"total": total, "valid": total - invalid, "invalid": invalid,
+                      "errors": errors, "dry_run": dry_run}
+            if dry_run:
+                return jsonify({"status": "success", **result})
+            if invalid and not skip_invalid:
+                return jsonify({"status": "error", "message": f"{invalid} invalid items, nothing imported", **result}), 422
+
+            # 第二遍：分批寫入
+            upload.seek(0)
+            written = import_public_db(iter_valid_chunks(parse(upload)))
+        return jsonify({"status": "success", "message": "Public DB updated", "imported": written, **result})
+    except ImportFormatError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
     except Exception as e:
-        return jsonify({"status": "error", "message": str(e)}), 500
\ No newline at end of file
+        return jsonify({"status": "error", "message": str(e)}), 500
+
+@api_bp.route('/api/export_public_data', methods=['GET'])
+def export_public_data():
+    """串流匯出 NDJSON (每行一筆商品)，可直接再用 /api/import_public_data?format=ndjson 匯入"""
+    items = get_catalog_snapshot().items
+    def generate():
+        for item in items:
+            yield json.dumps(item, ensure_ascii=False) + "\n"
+    headers = {"Content-Disposition": "attachment; filename=chiikawa_public_db.ndjson"}
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson", headers=headers)
+
+# --- 5. 圖片縮圖代理 (本機快取) ---
+@api_bp.route('/img/<key>', methods=['GET'])
+def image_proxy(key):
+    """/img/tphoto_xxx_b.png?size=list|modal|popup|original"""
+    size = request.args.get("size", "list")
+    if size != "original" and size not in THUMBNAIL_SIZES:
+        return jsonify({"status": "error", "message": f"Unknown size: {size}"}), 400
+    fmt = "webp" if "image/webp" in request.headers.get("Accept", "") else "jpeg"
+    try:
+        etag, path, mimetype = image_cache.thumbnail(key, size, fmt)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 502
+
+    response = send_file(os.path.abspath(path), mimetype=mimetype, etag=etag, conditional=True, max_age=IMAGE_MAX_AGE)
+    response.headers["Cache-Control"] = f"public, max-age={IMAGE_MAX_AGE}"
+    response.headers["Vary"] = "Accept"
+    return response
@@ -0,0 +1,89 @@
+import json
+import gzip
+import time
+import hashlib
+import threading
+import functools
+from services.catalog_index import CatalogIndex
+from services.storage import public_item
+from services.metrics import CATALOG_BYTES
+
+# brotli 為選用套件，沒裝的話只提供 gzip
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+CATALOG_CACHE_TTL = 300  # 秒；多個 worker 時其他 process 的寫入最晚這麼久後會看到 (0 = 不過期)
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 9
+
+class CatalogSnapshot:
+    """某一版目錄的預先序列化結果 (JSON + gzip / br 壓縮版 + 各自的 strong ETag)"""
+    def __init__(self, items, version):
+        self.items = items
+        self.version = version
+        self.body = json.dumps(items, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        self.etag = hashlib.sha1(self.body).hexdigest()
+        self.encoded = {"gzip": gzip.compress(self.body, GZIP_LEVEL)}
+        if brotli is not None:
+            self.encoded["br"] = brotli.compress(self.body, quality=BROTLI_QUALITY)
+        self.created_at = time.monotonic()
+
+    def etag_for(self, encoding=None):
+        # strong ETag 必須隨 Content-Encoding 不同 (同內容的壓縮版加後綴)
+        return f"{self.etag}-{encoding}" if encoding else self.etag
+
+    @property
+    def etags(self):
+        return [self.etag_for()] + [self.etag_for(e) for e in self.encoded]
+
+    @functools.cached_property
+    def index(self):
+        # 第一次有篩選查詢時才建立
+        return CatalogIndex(self.items)
+
+class CatalogCache:
+    """公有目錄的 read-through 快取：讀取時沒有就從後端載入，save_public_db 時直接換成新版本"""
+    def __init__(self, ttl=CATALOG_CACHE_TTL):
+        self.ttl = ttl
+        self._snapshot = None
+        self._lock = threading.Lock()
+
+    def _expired(self, snapshot):
+        return self.ttl and time.monotonic() - snapshot.created_at > self.ttl
+
+    def get(self, loader):
+        """loader() 回傳 (items, version)"""
+        snapshot = self._snapshot
+        if snapshot is not None and not self._expired(snapshot):
+            return snapshot
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is None or self._expired(snapshot):
+                snapshot = self._build(*loader())
+        return snapshot
+
+    def update(self, items, version):
+        """寫入後呼叫：直接換成新版本的內容"""
+        with self._lock:
+            return self._build(items, version)
+
+    def peek(self):
+        """目前快取中的版本 (不會觸發讀取，可能是 None)"""
+        return self._snapshot
+
+    def invalidate(self):
+        with self._lock:
+            self._snapshot = None
+
+    def _build(self, items, version):
+        # 複製一份 (同時去掉內部欄位)，避免呼叫端之後修改 item 影響快取內容
+        items = [public_item(i) for i in items or []]
+        snapshot = self._snapshot = CatalogSnapshot(items, version)
+        CATALOG_BYTES.set(len(snapshot.body), encoding="identity")
+        for encoding, body in snapshot.encoded.items():
+            CATALOG_BYTES.set(len(body), encoding=encoding)
+        return snapshot
+
+catalog_cache = CatalogCache()
@@ -0,0 +1,88 @@
+import math
+import base64
+import bisect
+from services.location import REGION_COORDS, CATEGORY_KEYWORDS
+from services.storage import item_key
+
+# 可篩選的值：地區沿用 REGION_COORDS，類別是爬蟲會產生的那幾種
+REGIONS = set(REGION_COORDS)
+CATEGORIES = set(CATEGORY_KEYWORDS.values()) | {"other"}
+DEFAULT_PAGE_SIZE = 200
+MAX_PAGE_SIZE = 1000
+
+class CatalogIndex:
+    """
+    某一版目錄的記憶體索引 (地區 / 類別 / id / 圖片 key / 緯度排序)。
+    查詢結果是依目錄順序排好的位置列表，不需要掃描每一筆商品。
+    """
+    def __init__(self, items):
+        self.items = items
+        self.by_region = {}
+        self.by_category = {}
+        self.by_id = {}
+        self.by_key = {}
+        located = []
+        for pos, item in enumerate(items):
+            if not isinstance(item, dict): continue
+            self.by_region.setdefault(item.get('region'), []).append(pos)
+            self.by_category.setdefault(item.get('category'), []).append(pos)
+            if item.get('id') is not None:
+                self.by_id.setdefault(str(item['id']), pos)
+            self.by_key.setdefault(item_key(item), pos)
+            lat, lng = item.get('lat'), item.get('lng')
+            if isinstance(lat, (int, float)) and isinstance(lng, (int, float)):
+                located.append((lat, lng, pos))
+        located.sort()
+        self._lats = [lat for lat, _, _ in located]
+        self._by_lat = located
+
+    def in_bbox(self, south, west, north, east):
+        start = bisect.bisect_left(self._lats, south)
+        end = bisect.bisect_right(self._lats, north)
+        return sorted(pos for _, lng, pos in self._by_lat[start:end] if west <= lng <= east)
+
+    def query(self, region=None, category=None, ids=None, bbox=None):
+        """回傳符合所有條件的商品位置 (依目錄順序)；沒有任何條件時回傳全部"""
+        candidates = []
+        if region is not None: candidates.append(self.by_region.get(region, []))
+        if category is not None: candidates.append(self.by_category.get(category, []))
+        if ids is not None:
+            found = {self.by_id.get(i, self.by_key.get(i)) for i in ids}
+            candidates.append(sorted(p for p in found if p is not None))
+        if bbox is not None: candidates.append(self.in_bbox(*bbox))
+        if not candidates:
+            return range(len(self.items))
+
+        # 從最短的列表開始交集
+        candidates.sort(key=len)
+        result = candidates[0]
+        for other in candidates[1:]:
+            other = set(other)
+            result = [p for p in result if p in other]
+        return result
+
+def parse_bbox(value):
+    """"南,西,北,東" -> [south, west, north, east]；數量不對或不是有限數字丟 ValueError"""
+    bbox = [float(v) for v in value.split(",")]
+    if len(bbox) != 4: raise ValueError("bbox needs south,west,north,east")
+    if not all(math.isfinite(v) for v in bbox): raise ValueError("bbox values must be finite numbers")
+    return bbox
+
+def encode_cursor(version, pos):
+    return base64.urlsafe_b64encode(f"{version}:{pos}".encode()).decode().rstrip("=")
+
+def decode_cursor(cursor):
+    """回傳 (version, 上一頁最後一筆的位置)；格式錯誤丟 ValueError"""
+    raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+    version, pos = raw.split(":")
+    return int(version), int(pos)
+
+def paginate(positions, after=-1, limit=DEFAULT_PAGE_SIZE):
+    """取出位置 > after 的前 limit 筆，回傳 (這頁的位置, 是否還有下一頁)"""
+    start = bisect.bisect_right(positions, after)
+    page = positions[start:start + limit]
+    return page, start + limit < len(positions)
+
+def project(item, fields):
+    if not fields: return item
+    return {f: item[f] for f in fields if f in item}
@@ -0,0 +1,86 @@
+import threading
+from collections import deque
+from services.storage import item_key
+
+MAX_CHANGE_ENTRIES = 5000   # 最多保留幾筆商品變動 (超過就丟掉最舊的版本)
+
+def diff_catalog(old_items, new_items):
+    """依圖片 key 比較兩份目錄，回傳 {"added": [item], "updated": [item], "removed": [key]}"""
+    old_map = {item_key(i): i for i in old_items if isinstance(i, dict)}
+    new_map = {item_key(i): i for i in new_items if isinstance(i, dict)}
+    return {
+        "added": [item for key, item in new_map.items() if key not in old_map],
+        "updated": [item for key, item in new_map.items() if key in old_map and old_map[key] != item],
+        "removed": [key for key in old_map if key not in new_map],
+    }
+
+class ChangeLog:
+    """
+    目錄各版本間的商品變動紀錄 (有上限)。
+    since(v) 會把 v 之後的所有變動合併成一份 added / updated / removed。
+    """
+    def __init__(self, max_entries=MAX_CHANGE_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = deque()   # (version, changes)
+        self._size = 0
+        self._base = None         # 能回溯到的最舊版本
+        self.version = None
+        self._cond = threading.Condition()
+
+    @staticmethod
+    def _count(changes):
+        return len(changes["added"]) + len(changes["updated"]) + len(changes["removed"])
+
+    def record(self, version, changes):
+        """changes 為 None 代表不知道差異 (例如整批匯入)，之前的版本都只能重新下載整份"""
+        with self._cond:
+            if changes is None or self.version is None:
+                self._entries.clear()
+                self._size = 0
+                self._base = version
+            else:
+                self._entries.append((version, changes))
+                self._size += self._count(changes)
+                while self._size > self.max_entries and self._entries:
+                    dropped_version, dropped = self._entries.popleft()
+                    self._size -= self._count(dropped)
+                    self._base = dropped_version
+            self.version = version
+            self._cond.notify_all()
+
+    def since(self, version):
+        """
+        回傳 version 之後的合併變動；沒有紀錄可回溯時回傳 None (客戶端需要重新下載整份)。
+        """
+        with self._cond:
+            if self.version is None or version > self.version or version < self._base:
+                return None
+            entries = [changes for v, changes in self._entries if v > version]
+
+        final = {}      # key -> 最新的 item (None = 已刪除)
+        existed = {}    # key -> 在 version 時是否存在
+        for changes in entries:
+            for item in changes["added"]:
+                key = item_key(item)
+                existed.setdefault(key, False)
+                final[key] = item
+            for item in changes["updated"]:
+                key = item_key(item)
+                existed.setdefault(key, True)
+                final[key] = item
+            for key in changes["removed"]:
+                existed.setdefault(key, True)
+                final[key] = None
+        return {
+            "added": [item for key, item in final.items() if item is not None and not existed[key]],
+            "updated": [item for key, item in final.items() if item is not None and existed[key]],
+            "removed": [key for key, item in final.items() if item is None and existed[key]],
+        }
+
+    def wait(self, version, timeout):
+        """等到版本比 version 新 (或逾時)，回傳目前版本"""
+        with self._cond:
+            self._cond.wait_for(lambda: self.version is not None and self.version != version, timeout)
+            return self.version
+
+change_log = ChangeLog()
@@ -1,8 +1,15 @@
 import requests
 import time
+import os
+import json
+import hashlib
+import asyncio
 import concurrent.futures # 🔥 新增：多工處理模組
-from bs4 import BeautifulSoup
-from services.location import REGION_KEYWORDS
+from urllib.parse import urlsplit
+import httpx
+from services.parser import parse_page, DEFAULT_BACKEND, PARSER_VERSION
+from services.location import keyword_tables_digest
+from services.metrics import CRAWL_FETCH_SECONDS, CRAWL_PARSE_SECONDS, CRAWL_PAGES, CRAWL_SECONDS
 
 BASE_URL = "https://www.jp-api.com/contents/NOD62/PGE{}/"
 DOMAIN = "https://www.jp-api.com"
@@ -10,69 +17,272 @@ HEADERS = {
     "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
 }
 
+# --- 非同步爬蟲設定 ---
+CRAWLER_MODE = "async"      # "async" (連線池 + 自動翻頁) 或 "threads" (舊版固定 10 頁)
+MAX_CONCURRENCY = 5         # 同時進行的請求數
+RATE_LIMIT_PER_SEC = 5      # 每個主機每秒最多發出的請求數
+MAX_RETRIES = 3             # 失敗重試次數
+RETRY_BACKOFF = 0.5         # 重試等待秒數 (每次加倍)
+MAX_PAGES = 200             # 自動翻頁的安全上限
+REQUEST_TIMEOUT = 10
+PARSER_BACKEND = DEFAULT_BACKEND  # "lxml" / "stream" / "bs4"，見 services/parser.py
+PARSE_PROCESSES = 0              # > 0 時解析階段改在 process pool 中執行 (大量頁面時使用)
+CRAWL_STATE_PATH = os.path.join("cache", "crawl_state.json")  # 每頁 ETag / 指紋 / 解析結果
+FULL_CRAWL_MAX_AGE = 24 * 3600   # 增量爬取看不到後面頁面的下架商品：距離上次完整爬取超過這麼久就完整爬一次
+
+class CrawlError(Exception):
+    """某一頁重試後仍然抓不到：不能當成目錄結尾，否則後面的商品會被當成下架"""
+
+def _domain_of(base_url):
+    parts = urlsplit(base_url)
+    return f"{parts.scheme}://{parts.netloc}"
+
 # 🔥 提取出單頁抓取的邏輯
 def fetch_page(page):
     url = BASE_URL.format(page)
     items = []
     try:
         # print(f"正在抓取第 {page} 頁...") # 註解掉避免 log 太多
+        start = time.perf_counter()
         resp = requests.get(url, headers=HEADERS, timeout=10)
+        CRAWL_FETCH_SECONDS.observe(time.perf_counter() - start, status=resp.status_code)
         resp.encoding = resp.apparent_encoding
-        if resp.status_code != 200: return []
-        
-        soup = BeautifulSoup(resp.content, "html.parser")
-        links = soup.find_all("a", class_="lightbox")
-        
-        for link in links:
-            name = link.get("title", "").strip()
-            if not name:
-                img = link.find("img")
-                if img: name = img.get("alt", "").strip()
-            if not name: continue
-
-            src = link.get("href", "")
-            img_url = DOMAIN + src if src.startswith("/") else src
-
-            region = "其他"
-            for r_key, keywords in REGION_KEYWORDS.items():
-                if any(k in name for k in keywords):
-                    region = r_key
-                    break
-            
-            category = "other"
-            if "ダイカットキーホルダー" in name:
-                category = "tag"
-            elif "ぬいぐるみキーチェーン" in name:
-                category = "plush"
-            elif "ソックス" in name or "靴下" in name:
-                category = "socks"
-
-            items.append({
-                "name": name,
-                "image": img_url,
-                "region": region,
-                "category": category
-            })
+        if resp.status_code != 200:
+            CRAWL_PAGES.inc(result="failed")
+            return []
+        with CRAWL_PARSE_SECONDS.time(backend=PARSER_BACKEND):
+            items = parse_page(resp.content, backend=PARSER_BACKEND)
+        CRAWL_PAGES.inc(result="parsed")
     except Exception as e:
+        CRAWL_PAGES.inc(result="failed")
         print(f"Page {page} error: {e}")
-    
+
     return items
 
+# --- 非同步版本 ---
+class HostRateLimiter:
+    """每個主機的請求間隔限制 (最少間隔 1 / rate 秒)"""
+    def __init__(self, rate_per_sec):
+        self.interval = 1.0 / rate_per_sec if rate_per_sec else 0
+        self._next_slot = {}
+        self._lock = asyncio.Lock()
+
+    async def wait(self, host):
+        if not self.interval: return
+        async with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+async def fetch_html(client, url, limiter, semaphore, retries=MAX_RETRIES, backoff=RETRY_BACKOFF, headers=None):
+    """
+    下載單頁，遇到連線錯誤 / 429 / 5xx 會退避重試。
+    回傳 200 / 304 的 response；其他 4xx (頁面不存在) 回傳 None；重試用完仍失敗則拋出 CrawlError
+    """
+    host = urlsplit(url).netloc
+    for attempt in range(retries + 1):
+        async with semaphore:
+            await limiter.wait(host)
+            start = time.perf_counter()
+            try:
+                resp = await client.get(url, headers=headers)
+            except httpx.HTTPError as e:
+                resp = None
+                error = e
+            CRAWL_FETCH_SECONDS.observe(time.perf_counter() - start,
+                                        status=resp.status_code if resp is not None else "error")
+        if resp is not None:
+            if resp.status_code in (200, 304):
+                return resp
+            if resp.status_code != 429 and resp.status_code < 500:
+                return None
+            error = f"HTTP {resp.status_code}"
+        if attempt < retries:
+            await asyncio.sleep(backoff * (2 ** attempt))
+    raise CrawlError(f"{url} error: {error}")
+
+# --- 增量爬取：每頁的 ETag / Last-Modified / 內容指紋 ---
+def load_crawl_state(path=CRAWL_STATE_PATH):
+    if os.path.exists(path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Crawl state unreadable, doing full crawl: {e}")
+    return {"pages": {}, "catalog": []}
+
+def save_crawl_state(state, path=CRAWL_STATE_PATH):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+async def fetch_page_state(client, url, cached, domain, limiter, semaphore,
+                           retries=MAX_RETRIES, backoff=RETRY_BACKOFF,
+                           backend=None, parse_executor=None):
+    """
+    條件式 GET：304 或內容指紋相同時直接沿用快取的解析結果。回傳 (items, page_state)
+    頁面不存在時回傳 ([], None)；抓取失敗時拋出 CrawlError
+    """
+    headers = {}
+    if cached:
+        if cached.get("etag"): headers["If-None-Match"] = cached["etag"]
+        if cached.get("last_modified"): headers["If-Modified-Since"] = cached["last_modified"]
+
+    try:
+        resp = await fetch_html(client, url, limiter, semaphore, retries, backoff, headers)
+        if resp is not None and resp.status_code == 304 and not cached:
+            raise CrawlError(f"{url} error: 304 without a cached copy")
+    except CrawlError:
+        CRAWL_PAGES.inc(result="failed")
+        raise
+    if resp is None:
+        CRAWL_PAGES.inc(result="missing")
+        return [], None
+    if resp.status_code == 304:
+        CRAWL_PAGES.inc(result="not_modified")
+        return cached["items"], cached
+
+    digest = hashlib.sha1(resp.content).hexdigest()
+    if cached and cached.get("hash") == digest:
+        CRAWL_PAGES.inc(result="unchanged")
+        items = cached["items"]
+    else:
+        # 下載與解析分開：有 executor 時把 CPU 密集的解析丟到其他 process，避開 GIL
+        # (解析時間從這裡量，process pool 裡的指標不會回到主 process)
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        items = await loop.run_in_executor(parse_executor, parse_page, resp.content, domain, backend)
+        CRAWL_PARSE_SECONDS.observe(time.perf_counter() - start, backend=backend or PARSER_BACKEND)
+        CRAWL_PAGES.inc(result="parsed")
+    return items, {
+        "etag": resp.headers.get("ETag"),
+        "last_modified": resp.headers.get("Last-Modified"),
+        "hash": digest,
+        "items": items,
+    }
+
+async def crawl_async(base_url=BASE_URL, max_concurrency=MAX_CONCURRENCY,
+                      rate_limit=RATE_LIMIT_PER_SEC, max_pages=MAX_PAGES,
+                      retries=MAX_RETRIES, backoff=RETRY_BACKOFF, state=None,
+                      backend=None, parse_executor=None, progress=None):
+    """
+    共用一個連線池抓取目錄。
+    - 沒有上次的結果：一次抓 max_concurrency 頁，直到遇到空白頁或重複頁為止
+    - 有上次的結果 (state)：逐頁抓取，遇到「商品全都看過」的頁面就停止，
+      剩下的部分直接沿用上次的結果 (新商品只會出現在最前面幾頁)
+    progress(page, 商品數) 會在每頁處理完後被呼叫
+    回傳 (items, new_state)；任何一頁重試後仍失敗就拋出 CrawlError (不會回傳不完整的目錄)
+    """
+    state = state or {"pages": {}, "catalog": []}
+    cached_pages = state.get("pages", {})
+    prev_catalog = state.get("catalog", [])
+    known = {i["image"] for i in prev_catalog}
+
+    domain = _domain_of(base_url)
+    limiter = HostRateLimiter(rate_limit)
+    semaphore = asyncio.Semaphore(max_concurrency)
+    limits = httpx.Limits(max_connections=max_concurrency, max_keepalive_connections=max_concurrency)
+    new_pages = dict(cached_pages)
+    all_items = []
+    seen_pages = set()
+
+    async with httpx.AsyncClient(headers=HEADERS, timeout=REQUEST_TIMEOUT, limits=limits,
+                                 follow_redirects=True) as client:
+        # 增量模式逐頁抓 (通常 1~2 個請求就結束)，完整模式整批並行
+        batch_size = 1 if known else max_concurrency
+        page = 1
+        done = False
+        while page <= max_pages and not done:
+            batch = range(page, min(page + batch_size, max_pages + 1))
+            results = await asyncio.gather(*(
+                fetch_page_state(client, base_url.format(p), cached_pages.get(str(p)),
+                                 domain, limiter, semaphore, retries, backoff,
+                                 backend or PARSER_BACKEND, parse_executor)
+                for p in batch
+            ), return_exceptions=True)
+            # 依頁碼順序處理，遇到空白頁或與前面重複的頁就停止 (目錄結尾之後的頁面失敗不影響結果)
+            for p, result in zip(batch, results):
+                if isinstance(result, BaseException):
+                    raise result
+                items, page_state = result
+                fingerprint = frozenset(i["image"] for i in items)
+                if not items or fingerprint in seen_pages:
+                    done = True
+                    break
+                seen_pages.add(fingerprint)
+                new_pages[str(p)] = page_state
+                all_items.extend(items)
+                if progress: progress(p, len(items))
+
+                if known and fingerprint <= known:
+                    # 🔥 已知頁面：後面的商品沿用上次的解析結果
+                    last_image = items[-1]["image"]
+                    pos = next(idx for idx, i in enumerate(prev_catalog) if i["image"] == last_image)
+                    fetched = {i["image"] for i in all_items}
+                    all_items.extend(i for i in prev_catalog[pos + 1:] if i["image"] not in fetched)
+                    done = True
+                    break
+            page += len(batch)
+
+    return all_items, {"pages": new_pages, "catalog": all_items}
+
+def _crawl_rules_digest(backend):
+    payload = [PARSER_VERSION, backend, keyword_tables_digest()]
+    return hashlib.sha1(json.dumps(payload).encode("utf-8")).hexdigest()
+
 # 🔥 主程式：改成並行處理
-def run_crawler():
-    print("🚀 啟動極速爬蟲 (多執行緒版)...")
+def run_crawler(mode=None, full=None, parse_processes=None, progress=None,
+                base_url=BASE_URL, state_path=CRAWL_STATE_PATH):
+    mode = mode or CRAWLER_MODE
+    parse_processes = PARSE_PROCESSES if parse_processes is None else parse_processes
     start_time = time.time()
-    all_items = []
-    
-    # 設定要抓幾頁 (例如 1~10 頁)
-    pages = range(1, 11) 
-    
-    # 同時開 5 個執行緒去抓
-    with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
-        results = executor.map(fetch_page, pages)
-        
-    for res in results:
-        all_items.extend(res)
-        
-    print(f"✅ 爬取完成！耗時: {time.time() - start_time:.2f} 秒，共 {len(all_items)} 筆")
-    return all_items
\ No newline at end of file
+
+    if mode == "async":
+        # 完整爬取：忽略上次的目錄，每一頁都重新確認 (仍會沿用 ETag / 指紋省下解析)
+        # full=None 時自動判斷：上次完整爬取太久以前，或解析規則 / 關鍵字表改變過
+        state = load_crawl_state(state_path)
+        rules = _crawl_rules_digest(PARSER_BACKEND)
+        if state.get("rules") != rules:
+            # 快取的地區 / 類別是用舊規則算的，整份作廢
+            state = {"pages": {}, "catalog": []}
+        if full is None:
+            full = time.time() - state.get("full_crawl_at", 0) > FULL_CRAWL_MAX_AGE
+        if full: state["catalog"] = []
+        print(f"🚀 啟動極速爬蟲 (非同步連線池版，{'增量' if state['catalog'] else '完整'})...")
+        try:
+            if parse_processes > 0:
+                with concurrent.futures.ProcessPoolExecutor(max_workers=parse_processes) as pool:
+                    all_items, new_state = asyncio.run(crawl_async(base_url, state=state, parse_executor=pool, progress=progress))
+            else:
+                all_items, new_state = asyncio.run(crawl_async(base_url, state=state, progress=progress))
+        except CrawlError as e:
+            # 🔥 不完整的目錄不能存成下次增量爬取的基準，上次的狀態保持不變
+            print(f"❌ 爬取中斷，保留上次的結果: {e}")
+            raise
+        if all_items:
+            new_state["rules"] = rules
+            new_state["full_crawl_at"] = time.time() if full else state.get("full_crawl_at", 0)
+            save_crawl_state(new_state, state_path)
+    else:
+        print("🚀 啟動極速爬蟲 (多執行緒版)...")
+        all_items = []
+
+        # 設定要抓幾頁 (例如 1~10 頁)
+        pages = range(1, 11)
+
+        # 同時開 5 個執行緒去抓
+        with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
+            results = executor.map(fetch_page, pages)
+
+        for page, res in zip(pages, results):
+            all_items.extend(res)
+            if progress: progress(page, len(res))
+
+    elapsed = time.time() - start_time
+    CRAWL_SECONDS.observe(elapsed, mode=mode)
+    print(f"✅ 爬取完成！耗時: {elapsed:.2f} 秒，共 {len(all_items)} 筆")
+    return all_items
@@ -1,28 +1,119 @@
 import os
-import json
-import firebase_admin
-from firebase_admin import credentials, db
-
-# --- Firebase 初始化 (負責公有資料) ---
-if not firebase_admin._apps:
-    if os.path.exists('/etc/secrets/serviceAccountKey.json'):
-        cred = credentials.Certificate('/etc/secrets/serviceAccountKey.json')
-    else:
-        cred = credentials.Certificate("serviceAccountKey.json")
-    
-    firebase_admin.initialize_app(cred, {
-        # 請確認這是您的 Firebase 網址
-        'databaseURL': 'https://chiikawalimitedtoregion-default-rtdb.asia-southeast1.firebasedatabase.app/' 
-    })
-
-# --- 公有資料庫操作 (Firebase) ---
+import time
+from services.storage import BACKENDS, public_item
+from services.cache import catalog_cache
+from services.geoindex import geo_index
+from services.changes import change_log, diff_catalog
+from services.metrics import BACKEND_SECONDS, BACKEND_ITEMS, BACKEND_WRITTEN
+
+# --- 公有資料的儲存後端：firebase (預設) 或 sqlite (本機離線) ---
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "firebase")
+
+_backend = None
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        _backend = BACKENDS[STORAGE_BACKEND]()
+    return _backend
+
+def set_backend(backend):
+    """替換儲存後端 (測試 / benchmark 用)"""
+    global _backend
+    _backend = backend
+
+def _backend_name(backend):
+    # FirebaseBackend -> "firebase"，給 /metrics 的標籤用
+    return type(backend).__name__.replace("Backend", "").lower()
+
+# --- 公有資料庫操作 ---
 def load_public_db():
-    """從 Firebase 讀取所有商品"""
-    ref = db.reference('public_items')
-    data = ref.get()
-    return data if data else []
+    """讀取所有商品"""
+    backend = get_backend()
+    start = time.perf_counter()
+    items = backend.load_all()
+    name = _backend_name(backend)
+    BACKEND_SECONDS.observe(time.perf_counter() - start, backend=name, operation="load")
+    BACKEND_ITEMS.observe(len(items or []), backend=name, operation="load")
+    return items
 
 def save_public_db(data):
-    """將商品資料寫入 Firebase"""
-    ref = db.reference('public_items')
-    ref.set(data)
\ No newline at end of file
+    """寫入商品資料 (各後端只寫入有變動的部分)，回傳寫入的筆數 / 路徑數"""
+    backend = get_backend()
+    start = time.perf_counter()
+    written = backend.save_all(data)
+    name = _backend_name(backend)
+    BACKEND_SECONDS.observe(time.perf_counter() - start, backend=name, operation="save")
+    BACKEND_ITEMS.observe(len(data), backend=name, operation="save")
+    BACKEND_WRITTEN.observe(written or 0, backend=name)
+
+    # 目錄版本 +1 並記錄變動 (完全沒變就沿用現有快取，不必重新序列化 / 壓縮整份目錄)
+    # 只比較公開欄位：只有 rules_fp 改變的商品不算變動，也不會讓目錄版本 +1
+    previous = catalog_cache.peek()
+    public = [public_item(i) for i in data]
+    if previous is not None and previous.items == public:
+        snapshot = previous
+    else:
+        changes = diff_catalog(previous.items, public) if previous is not None else None
+        if changes is not None and not any(changes.values()):
+            # 只有順序改變：變動紀錄無法表示，記成重設
+            changes = None
+        version = backend.next_version()
+        if previous is not None and version != previous.version + 1:
+            # 中間有其他 worker 寫入過：和本機舊快取比出來的差異不完整，只能記成重設
+            changes = None
+        snapshot = catalog_cache.update(public, version)
+        change_log.record(version, changes)
+    # 地圖網格只更新有變動的商品
+    geo_index.sync(snapshot.items, snapshot.version)
+    return written
+
+def import_public_db(chunks):
+    """分批寫入整份目錄 (取代現有內容)，回傳寫入筆數"""
+    backend = get_backend()
+    total = 0
+    try:
+        for chunk in chunks:
+            backend.write_range(total, chunk)
+            total += len(chunk)
+        backend.truncate(total)
+    finally:
+        # 寫入途中失敗也要讓快取重新讀取；整批匯入不記錄逐筆變動
+        catalog_cache.invalidate()
+        change_log.record(backend.next_version(), None)
+    return total
+
+def get_catalog_version():
+    return get_backend().get_version()
+
+def _load_catalog():
+    items, version = load_public_db(), get_catalog_version()
+    if change_log.version != version:
+        # 其他 process 寫入過 (或剛啟動)：更早的版本只能重新下載整份
+        change_log.record(version, None)
+    return items, version
+
+def get_catalog_snapshot():
+    """目前版本的目錄 (有快取就不讀後端)"""
+    return catalog_cache.get(_load_catalog)
+
+def get_catalog_changes(since):
+    """since 版本之後的變動；無法回溯時回傳 None"""
+    get_catalog_snapshot()
+    return change_log.since(since)
+
+def get_geo_index():
+    """與目前目錄版本同步的地圖網格索引"""
+    snapshot = get_catalog_snapshot()
+    if geo_index.version != snapshot.version:
+        geo_index.sync(snapshot.items, snapshot.version)
+    return geo_index, snapshot
+
+def get_public_item(key):
+    """以圖片 key 查單筆商品"""
+    return public_item(get_backend().get_by_key(key))
+
+def query_public_items(region=None, category=None, limit=None, offset=0):
+    """依地區 / 類別篩選 (sqlite 後端走索引，不會載入整份目錄)"""
+    items = get_backend().query(region=region, category=category, limit=limit, offset=offset)
+    return [public_item(i) for i in items]
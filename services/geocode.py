@@ -0,0 +1,126 @@
+import os
+import json
+import time
+import threading
+from services.location import LOCATION_CORRECTIONS, get_region_from_address
+
+GEOCODE_CACHE_PATH = os.path.join("cache", "geocode_cache.json")
+GEOCODE_TTL = 30 * 24 * 3600         # 查到的結果保留 30 天
+GEOCODE_MISS_TTL = 24 * 3600         # 查不到的地點 1 天後再試
+GEOCODE_MIN_DELAY = 1.0              # Nominatim 規定每秒最多 1 個請求
+GEOCODE_MAX_LOOKUPS = 30             # 每批最多實際查詢幾個地點 (其餘下次再查)
+GEOCODE_USER_AGENT = "chiikawa-limited-to-region"
+
+class GeocodeCache:
+    """地點字串 -> 座標 的磁碟快取 (JSON)，每筆有到期時間"""
+    def __init__(self, path=GEOCODE_CACHE_PATH):
+        self.path = path
+        self._entries = None
+        self._dirty = False
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._entries is None:
+            self._entries = {}
+            if self.path and os.path.exists(self.path):
+                try:
+                    with open(self.path, "r", encoding="utf-8") as f:
+                        self._entries = json.load(f)
+                except (OSError, ValueError) as e:
+                    print(f"Geocode cache unreadable, starting empty: {e}")
+        return self._entries
+
+    def get(self, query):
+        """回傳 (命中與否, 結果)；結果為 None 代表「查過但查不到」"""
+        with self._lock:
+            entry = self._load().get(query)
+        if entry is None or entry["expires"] < time.time():
+            return False, None
+        return True, entry["result"]
+
+    def set(self, query, result):
+        ttl = GEOCODE_TTL if result is not None else GEOCODE_MISS_TTL
+        with self._lock:
+            self._load()[query] = {"result": result, "expires": time.time() + ttl}
+            self._dirty = True
+
+    def save(self):
+        with self._lock:
+            if not self._dirty or not self.path: return
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._entries, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+            self._dirty = False
+
+class BatchGeocoder:
+    """
+    批次地理編碼：整份目錄的 search_location 去重複後，每個地點最多查一次。
+    geocoder 需提供 geocode(query) -> 具 latitude / longitude / address 的物件 (geopy 介面)，
+    預設使用 Nominatim；測試時可傳入本機的替身。
+    """
+    def __init__(self, geocoder=None, cache=None, min_delay=GEOCODE_MIN_DELAY, max_lookups=GEOCODE_MAX_LOOKUPS):
+        self._geocoder = geocoder
+        self.cache = cache if cache is not None else GeocodeCache()
+        self.min_delay = min_delay
+        self.max_lookups = max_lookups
+        self._last_call = 0.0
+
+    @property
+    def geocoder(self):
+        if self._geocoder is None:
+            from geopy.geocoders import Nominatim
+            self._geocoder = Nominatim(user_agent=GEOCODE_USER_AGENT, timeout=10)
+        return self._geocoder
+
+    def _throttle(self):
+        wait = self._last_call + self.min_delay - time.monotonic()
+        if wait > 0: time.sleep(wait)
+        self._last_call = time.monotonic()
+
+    def _lookup(self, query):
+        self._throttle()
+        location = self.geocoder.geocode(query)
+        if location is None:
+            return None
+        address = getattr(location, "address", "") or ""
+        return {
+            "lat": location.latitude,
+            "lng": location.longitude,
+            "region": get_region_from_address(address) or get_region_from_address(query) or "其他",
+            "address": address,
+        }
+
+    def resolve_many(self, locations):
+        """回傳 {地點: {"lat", "lng", "region", "address"}}，只包含查得到的地點"""
+        pending = {loc.strip() for loc in locations if loc and loc.strip()}
+        pending -= LOCATION_CORRECTIONS.keys()   # 修正表優先，不需要查
+
+        resolved = {}
+        lookups = 0
+        for loc in sorted(pending):
+            hit, result = self.cache.get(loc)
+            if not hit:
+                if lookups >= self.max_lookups: continue
+                lookups += 1
+                try:
+                    result = self._lookup(loc)
+                except Exception as e:
+                    # 網路錯誤不寫入快取，下次再試
+                    print(f"Geocode {loc} error: {e}")
+                    continue
+                self.cache.set(loc, result)
+            if result is not None:
+                resolved[loc] = result
+        self.cache.save()
+        return resolved
+
+def build_corrections(items, geocoder=None, cache_only=False):
+    """
+    整份目錄的 地點 -> 修正資料：手動修正表優先，其餘用地理編碼結果。
+    cache_only=True 時只用快取 (給同步的 API 請求用，不會連線查詢；沒快取的地點等下次更新再查)
+    """
+    geocoder = geocoder or BatchGeocoder(max_lookups=0 if cache_only else GEOCODE_MAX_LOOKUPS)
+    resolved = geocoder.resolve_many(i.get('search_location', '') for i in items if isinstance(i, dict))
+    return {**resolved, **LOCATION_CORRECTIONS}
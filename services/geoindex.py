@@ -0,0 +1,138 @@
+import math
+import threading
+from services.storage import item_key
+
+MAX_CLUSTER_ZOOM = 18
+CELLS_PER_TILE = 4          # 每個 256px 地圖格切成 4x4，約 64px 一群
+CLUSTER_DETAIL_LIMIT = 20   # 群內商品數不超過這個數時，一併回傳商品 key
+
+def cell_size(zoom):
+    """該縮放等級下一格的經緯度寬度"""
+    return 360.0 / (2 ** zoom) / CELLS_PER_TILE
+
+class GridIndex:
+    """
+    各縮放等級的網格索引：格子 -> {(地區, 類別): [商品 key 集合, 緯度總和, 經度總和]}。
+    縮放等級第一次被查詢時才建立，之後 sync() 只更新有變動的商品。
+    """
+    def __init__(self):
+        self.version = None
+        self._points = {}   # key -> (lat, lng, region, category)
+        self._levels = {}   # zoom -> {cell: {pair: [keys, sum_lat, sum_lng]}}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _point(item):
+        lat, lng = item.get('lat'), item.get('lng')
+        if not isinstance(lat, (int, float)) or not isinstance(lng, (int, float)):
+            return None
+        return (lat, lng, item.get('region'), item.get('category'))
+
+    @staticmethod
+    def _cell(zoom, lat, lng):
+        size = cell_size(zoom)
+        return (math.floor(lat / size), math.floor(lng / size))
+
+    def _add(self, key, point, levels):
+        lat, lng, region, category = point
+        for zoom, cells in levels.items():
+            bucket = cells.setdefault(self._cell(zoom, lat, lng), {})
+            agg = bucket.setdefault((region, category), [set(), 0.0, 0.0])
+            agg[0].add(key)
+            agg[1] += lat
+            agg[2] += lng
+
+    def _remove(self, key, point):
+        lat, lng, region, category = point
+        for zoom, cells in self._levels.items():
+            cell = self._cell(zoom, lat, lng)
+            bucket = cells[cell]
+            agg = bucket[(region, category)]
+            agg[0].discard(key)
+            agg[1] -= lat
+            agg[2] -= lng
+            if not agg[0]:
+                del bucket[(region, category)]
+                if not bucket: del cells[cell]
+
+    def sync(self, items, version=None):
+        """與目前的目錄同步，只處理新增 / 刪除 / 座標或分類有變的商品。回傳變動筆數"""
+        points = {}
+        for item in items:
+            if not isinstance(item, dict): continue
+            point = self._point(item)
+            if point is None: continue
+            key = item_key(item)
+            n = 1
+            while key in points:  # 同一張圖重複出現時仍各自計數
+                n += 1
+                key = f"{item_key(item)}#{n}"
+            points[key] = point
+
+        with self._lock:
+            changed = 0
+            for key, point in self._points.items():
+                if points.get(key) != point:
+                    self._remove(key, point)
+                    changed += 1
+            for key, point in points.items():
+                if self._points.get(key) != point:
+                    self._add(key, point, self._levels)
+                    changed += 1
+            self._points = points
+            self.version = version
+        return changed
+
+    def _level(self, zoom):
+        cells = self._levels.get(zoom)
+        if cells is None:
+            cells = {}
+            for key, point in self._points.items():
+                self._add(key, point, {zoom: cells})
+            self._levels[zoom] = cells
+        return cells
+
+    def clusters(self, zoom, bbox=None, region=None, category=None):
+        """回傳視窗內的群集 (重心、數量、各地區 / 類別數量)"""
+        zoom = max(0, min(int(zoom), MAX_CLUSTER_ZOOM))
+        with self._lock:
+            cells = self._level(zoom)
+            if bbox is not None:
+                south, west, north, east = bbox
+                (y0, x0), (y1, x1) = self._cell(zoom, south, west), self._cell(zoom, north, east)
+                if (y1 - y0 + 1) * (x1 - x0 + 1) < len(cells):
+                    selected = ((c, cells[c]) for c in ((y, x) for y in range(y0, y1 + 1)
+                                for x in range(x0, x1 + 1)) if c in cells)
+                else:
+                    selected = ((c, b) for c, b in cells.items() if y0 <= c[0] <= y1 and x0 <= c[1] <= x1)
+            else:
+                selected = cells.items()
+
+            result = []
+            for cell, bucket in selected:
+                count, sum_lat, sum_lng, keys = 0, 0.0, 0.0, []
+                regions, categories = {}, {}
+                for (r, c), (members, s_lat, s_lng) in bucket.items():
+                    if region is not None and r != region: continue
+                    if category is not None and c != category: continue
+                    n = len(members)
+                    count += n
+                    sum_lat += s_lat
+                    sum_lng += s_lng
+                    regions[r] = regions.get(r, 0) + n
+                    categories[c] = categories.get(c, 0) + n
+                    if len(keys) <= CLUSTER_DETAIL_LIMIT: keys.extend(members)
+                if not count: continue
+                cluster = {
+                    "lat": sum_lat / count,
+                    "lng": sum_lng / count,
+                    "count": count,
+                    "regions": regions,
+                    "categories": categories,
+                }
+                if count <= CLUSTER_DETAIL_LIMIT:
+                    cluster["keys"] = sorted(k.split("#")[0] for k in keys)
+                result.append(cluster)
+        return result
+
+geo_index = GridIndex()
@@ -0,0 +1,127 @@
+import io
+import os
+import re
+import time
+import hashlib
+import threading
+import concurrent.futures
+import requests
+
+# Pillow 列在 requirements.txt；沒裝的話所有尺寸都只能回傳原圖
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+    print("⚠️ Pillow is not installed: /img/<key> will serve full-size originals (pip install Pillow)")
+
+IMAGE_SOURCE_URL = "https://www.jp-api.com/images/{}"
+IMAGE_CACHE_DIR = os.path.join("cache", "images")
+IMAGE_REF_TTL = 7 * 24 * 3600   # 圖片 key 對應的內容多久重新下載確認一次
+THUMBNAIL_SIZES = {"popup": 80, "list": 320, "modal": 960}   # 長邊像素
+THUMBNAIL_QUALITY = 80
+WARMUP_WORKERS = 8
+IMAGE_KEY_RE = re.compile(r"^[\w.-]+\.(png|jpe?g|gif|webp)$", re.I)
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+}
+
+_MIMETYPES = {"png": "image/png", "jpg": "image/jpeg", "jpeg": "image/jpeg", "gif": "image/gif",
+              "webp": "image/webp"}
+
+class ImageCache:
+    """
+    來源圖片只下載一次，依內容 sha256 存放 (objects/ab/<hash>.<ext>)；
+    refs/<key> 記錄圖片 key 對應的 hash，縮圖存在 thumbs/<hash>_<尺寸>.<格式>。
+    """
+    def __init__(self, root=IMAGE_CACHE_DIR, source_url=IMAGE_SOURCE_URL):
+        self.root = root
+        self.source_url = source_url
+        self._session = requests.Session()
+        self._session.headers.update(HEADERS)
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+
+    def _lock_for(self, name):
+        with self._locks_lock:
+            return self._locks.setdefault(name, threading.Lock())
+
+    def _path(self, *parts):
+        return os.path.join(self.root, *parts)
+
+    @staticmethod
+    def _write(path, data):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def original(self, key):
+        """回傳 (內容 hash, 原圖路徑)；沒有快取時下載一次"""
+        if not IMAGE_KEY_RE.match(key):
+            raise ValueError(f"Bad image key: {key}")
+        ext = key.rsplit(".", 1)[1].lower()
+        ref_path = self._path("refs", key)
+        with self._lock_for(key):
+            if os.path.exists(ref_path) and time.time() - os.path.getmtime(ref_path) < IMAGE_REF_TTL:
+                with open(ref_path, "r", encoding="utf-8") as f:
+                    digest = f.read().strip()
+                obj_path = self._path("objects", digest[:2], f"{digest}.{ext}")
+                if os.path.exists(obj_path):
+                    return digest, obj_path
+
+            resp = self._session.get(self.source_url.format(key), timeout=15)
+            resp.raise_for_status()
+            digest = hashlib.sha256(resp.content).hexdigest()
+            obj_path = self._path("objects", digest[:2], f"{digest}.{ext}")
+            if not os.path.exists(obj_path):
+                self._write(obj_path, resp.content)
+            self._write(ref_path, digest.encode("utf-8"))
+        return digest, obj_path
+
+    def thumbnail(self, key, size="list", fmt="webp"):
+        """回傳 (內容 hash, 檔案路徑, mimetype)；沒有 Pillow 或 size=original 時回傳原圖"""
+        digest, obj_path = self.original(key)
+        if Image is None or size not in THUMBNAIL_SIZES:
+            return digest, obj_path, _MIMETYPES.get(obj_path.rsplit(".", 1)[1], "application/octet-stream")
+
+        fmt = "webp" if fmt == "webp" else "jpeg"
+        thumb_path = self._path("thumbs", digest[:2], f"{digest}_{size}.{fmt}")
+        with self._lock_for(thumb_path):
+            if not os.path.exists(thumb_path):
+                self._write(thumb_path, self._resize(obj_path, THUMBNAIL_SIZES[size], fmt))
+        return f"{digest}_{size}_{fmt}", thumb_path, f"image/{fmt}"
+
+    @staticmethod
+    def _resize(path, max_side, fmt):
+        with Image.open(path) as img:
+            img.thumbnail((max_side, max_side))
+            if fmt == "jpeg":
+                # JPEG 沒有透明度，貼到白底上
+                img = img.convert("RGBA")
+                background = Image.new("RGB", img.size, (255, 255, 255))
+                background.paste(img, mask=img.getchannel("A"))
+                img = background
+            elif img.mode not in ("RGB", "RGBA"):
+                img = img.convert("RGBA")
+            out = io.BytesIO()
+            img.save(out, format=fmt.upper(), quality=THUMBNAIL_QUALITY)
+            return out.getvalue()
+
+    def warm(self, keys, sizes=("list", "popup"), max_workers=WARMUP_WORKERS):
+        """平行預先下載原圖並產生縮圖，回傳成功的數量"""
+        def prefetch(key):
+            try:
+                for size in sizes:
+                    self.thumbnail(key, size)
+                return True
+            except Exception as e:
+                print(f"Image warm-up {key} error: {e}")
+                return False
+
+        keys = [k for k in dict.fromkeys(keys) if k and IMAGE_KEY_RE.match(k)]
+        if not keys: return 0
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return sum(executor.map(prefetch, keys))
+
+image_cache = ImageCache()
@@ -0,0 +1,170 @@
+import io
+import json
+import math
+import tempfile
+from services.catalog_index import REGIONS, CATEGORIES
+
+READ_CHUNK_SIZE = 64 * 1024
+WRITE_CHUNK_SIZE = 500
+MAX_REPORTED_ERRORS = 100
+SPOOL_MAX_MEMORY = 1024 * 1024   # 上傳內容超過 1MB 就暫存到磁碟
+
+class ImportFormatError(ValueError):
+    """上傳內容不是合法的 JSON 陣列 / NDJSON"""
+
+# --- 逐步解析 ---
+def _text_reader(stream):
+    if isinstance(stream, io.TextIOBase): return stream, False
+    return io.TextIOWrapper(stream, encoding="utf-8-sig"), True
+
+def iter_json_array(stream, chunk_size=READ_CHUNK_SIZE):
+    """一次讀一段，逐筆產生頂層 JSON 陣列中的元素 (不需要整份載入記憶體)"""
+    reader, wrapped = _text_reader(stream)
+    try:
+        yield from _iter_json_array(reader, chunk_size)
+    finally:
+        # 不要讓 TextIOWrapper 把原本的 stream 關掉 (匯入時會讀兩遍)
+        if wrapped: reader.detach()
+
+def _iter_json_array(reader, chunk_size):
+    decoder = json.JSONDecoder()
+    buffer = ""
+    pos = 0
+    started = False
+    expect_value = True
+    seen_value = False
+    eof = False
+
+    def fill():
+        nonlocal buffer, pos, eof
+        data = reader.read(chunk_size)
+        if not data:
+            eof = True
+        buffer = buffer[pos:] + data
+        pos = 0
+
+    while True:
+        # 跳過空白，必要時補資料
+        while True:
+            while pos < len(buffer) and buffer[pos].isspace(): pos += 1
+            if pos < len(buffer) or eof: break
+            fill()
+        if pos >= len(buffer):
+            raise ImportFormatError("Unexpected end of JSON" if started else "Empty upload")
+
+        ch = buffer[pos]
+        if not started:
+            if ch != "[": raise ImportFormatError("Upload must be a JSON array")
+            started = True
+            pos += 1
+            continue
+        if ch == "]":
+            if expect_value and seen_value:
+                raise ImportFormatError("Trailing comma before ']'")
+            # 陣列結束後只能有空白
+            pos += 1
+            while True:
+                while pos < len(buffer) and buffer[pos].isspace(): pos += 1
+                if pos < len(buffer):
+                    raise ImportFormatError(f"Unexpected data after the array: {buffer[pos:pos + 20]!r}")
+                if eof: return
+                fill()
+        if not expect_value:
+            if ch != ",": raise ImportFormatError(f"Expected ',' or ']' near: {buffer[pos:pos + 20]!r}")
+            expect_value = True
+            pos += 1
+            continue
+
+        # 解析一個值；buffer 裡的值不完整時補資料再試
+        while True:
+            try:
+                value, end = decoder.raw_decode(buffer, pos)
+                # 數字可能剛好被切在 chunk 邊界 (例如 "34." + "96")：後面還沒看到 , 或 ] 就補資料再解析一次
+                if not eof:
+                    nxt = end
+                    while nxt < len(buffer) and buffer[nxt].isspace(): nxt += 1
+                    if nxt == len(buffer) or (_is_number(value) and buffer[nxt] not in ",]"):
+                        fill()
+                        continue
+                break
+            except json.JSONDecodeError as e:
+                if eof: raise ImportFormatError(str(e))
+                fill()
+        pos = end
+        expect_value = False
+        seen_value = True
+        yield value
+
+def iter_ndjson(stream):
+    """每行一筆 JSON"""
+    reader, wrapped = _text_reader(stream)
+    try:
+        for line_no, line in enumerate(reader, 1):
+            if not line.strip(): continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as e:
+                raise ImportFormatError(f"Line {line_no}: {e}")
+    finally:
+        if wrapped: reader.detach()
+
+# --- 驗證 ---
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+def validate_item(item):
+    """回傳錯誤訊息列表 (空列表代表合法)"""
+    if not isinstance(item, dict):
+        return ["item must be an object"]
+    errors = []
+    item_id = item.get('id')
+    if not isinstance(item_id, int) or isinstance(item_id, bool) or item_id < 1:
+        errors.append("id must be a positive integer")
+    if not isinstance(item.get('name'), str) or not item['name'].strip():
+        errors.append("name must be a non-empty string")
+    if not isinstance(item.get('image'), str):
+        errors.append("image must be a string")
+    if not _is_number(item.get('lat')) or not -90 <= item['lat'] <= 90:
+        errors.append("lat must be a number between -90 and 90")
+    if not _is_number(item.get('lng')) or not -180 <= item['lng'] <= 180:
+        errors.append("lng must be a number between -180 and 180")
+    if item.get('region') not in REGIONS:
+        errors.append(f"region must be one of {sorted(REGIONS)}")
+    if item.get('category') not in CATEGORIES:
+        errors.append(f"category must be one of {sorted(CATEGORIES)}")
+    return errors
+
+def spool_upload(stream):
+    """把上傳內容存進暫存檔 (小的留在記憶體)，讓驗證與寫入可以各讀一次"""
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY)
+    while True:
+        data = stream.read(READ_CHUNK_SIZE)
+        if not data: break
+        spool.write(data)
+    spool.seek(0)
+    return spool
+
+def validate_stream(items):
+    """逐筆驗證，回傳 (總筆數, 不合法筆數, 錯誤報告)"""
+    total = invalid = 0
+    report = []
+    for index, item in enumerate(items):
+        total += 1
+        errors = validate_item(item)
+        if errors:
+            invalid += 1
+            if len(report) < MAX_REPORTED_ERRORS:
+                report.append({"index": index, "id": item.get('id') if isinstance(item, dict) else None, "errors": errors})
+    return total, invalid, report
+
+def iter_valid_chunks(items, chunk_size=WRITE_CHUNK_SIZE):
+    """只留下合法的商品，每 chunk_size 筆產生一批"""
+    chunk = []
+    for item in items:
+        if validate_item(item): continue
+        chunk.append(item)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
@@ -0,0 +1,257 @@
+import os
+import json
+import time
+import uuid
+import threading
+import traceback
+
+# 檔案鎖：fcntl (Linux / macOS) 或 msvcrt (Windows)
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+MAX_JOB_HISTORY = 50
+SCHEDULER_LOCK_PATH = os.path.join("cache", "scheduler.lock")
+JOB_STATE_DIR = os.path.join("cache", "jobs")   # 工作狀態 (JSON) 與每種工作的檔案鎖，所有 worker 共用
+JOB_PERSIST_INTERVAL = 1.0                      # 進度更新最多每秒寫入磁碟一次
+
+class Job:
+    """一個背景工作的狀態與進度"""
+    def __init__(self, name):
+        self.id = uuid.uuid4().hex[:12]
+        self.name = name
+        self.status = "queued"    # queued / running / succeeded / failed
+        self.progress = {}
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._on_change = None
+        self._persisted_at = 0.0
+
+    def wait(self, timeout=None):
+        """等工作結束 (成功或失敗)，逾時回傳 False"""
+        return self._done.wait(timeout)
+
+    def update(self, **fields):
+        with self._lock:
+            self.progress.update(fields)
+        if self._on_change and time.monotonic() - self._persisted_at >= JOB_PERSIST_INTERVAL:
+            self._on_change(self)
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "id": self.id,
+                "name": self.name,
+                "status": self.status,
+                "progress": dict(self.progress),
+                "result": self.result,
+                "error": self.error,
+                "created_at": self.created_at,
+                "started_at": self.started_at,
+                "finished_at": self.finished_at,
+            }
+
+class StoredJob:
+    """其他 worker 的工作 (從 JOB_STATE_DIR 讀出來的狀態，唯讀)"""
+    def __init__(self, data):
+        self._data = data
+        self.id = data["id"]
+        self.name = data["name"]
+        self.status = data["status"]
+
+    def to_dict(self):
+        return dict(self._data)
+
+class JobRunner:
+    """
+    在背景執行緒跑工作；同名工作同時只會有一個在跑。
+    多個 worker 時以 state_dir/<name>.lock 檔案鎖確保整個服務只有一個在跑，
+    工作狀態寫入 state_dir/<id>.json，任何 worker 都查得到。
+    """
+    def __init__(self, history=MAX_JOB_HISTORY, state_dir=JOB_STATE_DIR):
+        self.history = history
+        self.state_dir = state_dir
+        self._jobs = {}
+        self._active = {}   # name -> 正在跑的 Job
+        self._locks = {}    # name -> 持有中的檔案鎖
+        self._lock = threading.Lock()
+
+    def submit(self, name, func):
+        """
+        開始一個背景工作，func(progress=job.update) 的回傳值會存進 job.result。
+        回傳 (job, created)；同名工作已在跑 (這個或其他 worker) 時回傳該工作與 False。
+        """
+        with self._lock:
+            active = self._active.get(name)
+            if active is not None:
+                return active, False
+            lock = self._try_lock(name)
+            if lock is None:
+                return self._active_elsewhere(name), False
+            job = Job(name)
+            job._on_change = self._persist
+            self._active[name] = job
+            self._locks[name] = lock
+            self._jobs[job.id] = job
+            while len(self._jobs) > self.history:
+                oldest = next(iter(self._jobs))
+                if self._jobs[oldest] in self._active.values(): break
+                del self._jobs[oldest]
+        if self.state_dir:
+            self._write_file(self._active_path(name), job.id)
+        self._persist(job)
+
+        threading.Thread(target=self._run, args=(job, func), name=f"job-{name}", daemon=True).start()
+        return job, True
+
+    def _run(self, job, func):
+        job.status = "running"
+        job.started_at = time.time()
+        self._persist(job)
+        try:
+            job.result = func(progress=job.update)
+            job.status = "succeeded"
+        except Exception as e:
+            traceback.print_exc()
+            job.error = str(e)
+            job.status = "failed"
+            if job.progress.get("write_status") == "writing":
+                job.update(write_status="error")
+        finally:
+            job.finished_at = time.time()
+            self._persist(job)
+            self._prune()
+            with self._lock:
+                self._active.pop(job.name, None)
+                _release_process_lock(self._locks.pop(job.name, None))
+            job._done.set()
+
+    def get(self, job_id):
+        """這個 worker 的工作，或其他 worker 寫入磁碟的工作狀態"""
+        job = self._jobs.get(job_id)
+        if job is not None or not self.state_dir or not job_id.isalnum():
+            return job
+        data = self._read_json(self._job_path(job_id))
+        return StoredJob(data) if data else None
+
+    def active(self, name):
+        return self._active.get(name)
+
+    # --- 跨 worker 的狀態 ---
+    def _job_path(self, job_id):
+        return os.path.join(self.state_dir, f"{job_id}.json")
+
+    def _active_path(self, name):
+        return os.path.join(self.state_dir, f"{name}.active")
+
+    def _try_lock(self, name):
+        if not self.state_dir:
+            return True
+        return _acquire_process_lock(os.path.join(self.state_dir, f"{name}.lock"), hold=False)
+
+    def _active_elsewhere(self, name):
+        try:
+            with open(self._active_path(name), "r", encoding="utf-8") as f:
+                job_id = f.read().strip()
+        except OSError:
+            job_id = ""
+        job = self.get(job_id) if job_id else None
+        return job or StoredJob({"id": job_id, "name": name, "status": "running", "progress": {},
+                                 "result": None, "error": None})
+
+    def _persist(self, job):
+        if not self.state_dir: return
+        job._persisted_at = time.monotonic()
+        try:
+            self._write_file(self._job_path(job.id), json.dumps(job.to_dict(), ensure_ascii=False))
+        except (OSError, TypeError) as e:
+            print(f"Job {job.id} state not saved: {e}")
+
+    def _prune(self):
+        # 磁碟上只保留最近 history 個工作的狀態
+        if not self.state_dir: return
+        try:
+            paths = [os.path.join(self.state_dir, n) for n in os.listdir(self.state_dir) if n.endswith(".json")]
+            paths.sort(key=os.path.getmtime, reverse=True)
+            for path in paths[self.history:]:
+                os.remove(path)
+        except OSError:
+            pass
+
+    @staticmethod
+    def _write_file(path, text):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _read_json(path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def schedule(self, name, func, interval, lock_path=SCHEDULER_LOCK_PATH):
+        """
+        每 interval 秒提交一次工作 (上一次還沒跑完就跳過這次)。
+        多個 process (例如 gunicorn 的每個 worker) 都呼叫時，只有拿到 lock_path 檔案鎖的那個會真的排程。
+        """
+        if lock_path and not _acquire_process_lock(lock_path):
+            print(f"⏰ Scheduler for {name} already running in another process, skipping")
+            return None
+
+        def loop():
+            while True:
+                time.sleep(interval)
+                job, created = self.submit(name, func)
+                if created: print(f"⏰ Scheduled {name} job started: {job.id}")
+
+        thread = threading.Thread(target=loop, name=f"schedule-{name}", daemon=True)
+        thread.start()
+        return thread
+
+_held_locks = []   # 持有到 process 結束 (檔案關閉就會釋放鎖)
+
+def _acquire_process_lock(path, hold=True):
+    """
+    非阻塞地取得檔案鎖。hold=True 時持有到 process 結束並回傳 True；
+    hold=False 時回傳開啟的檔案 (交給 _release_process_lock 釋放)。拿不到鎖回傳 False / None。
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    f = open(path, "a+")
+    try:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        f.close()
+        return False if hold else None
+    if not hold:
+        return f
+    _held_locks.append(f)
+    return True
+
+def _release_process_lock(f):
+    if f is None or f is True: return
+    try:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_UN)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+    finally:
+        f.close()
+
+job_runner = JobRunner()
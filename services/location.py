@@ -1,4 +1,7 @@
-from geopy.geocoders import Nominatim
+import math
+import json
+import hashlib
+from types import MappingProxyType
 
 # --- 🔥 強制座標修正表 ---
 # 這裡列出的地點，程式會直接使用設定好的座標，不再去問地圖 (避免問錯)
@@ -156,10 +159,177 @@ REGION_KEYWORDS = {
     "海外": ["香港", "澳門", "台灣", "澳洲", "ハワイ"]
 }
 
+# --- 商品類別 (依順序優先) ---
+CATEGORY_KEYWORDS = {
+    "ダイカットキーホルダー": "tag",
+    "ぬいぐるみキーチェーン": "plush",
+    "ソックス": "socks",
+    "靴下": "socks",
+}
+
+# 視為「機場 / 其他」的關鍵字
+AIRPORT_NAME_KEYWORDS = ["パイロット", "飛行機", "CA"]
+AIRPORT_LOCATION_KEYWORDS = ["空港", "機場"]
+
+# 🔒 比對器用到的表在載入後凍結 (就地修改會直接報錯)；
+# 執行中要換規則請整個替換 (例如 location.REGION_KEYWORDS = {...})，比對器會自動重建
+REGION_KEYWORDS = MappingProxyType({region: tuple(kws) for region, kws in REGION_KEYWORDS.items()})
+PREFECTURE_TO_REGION = MappingProxyType(dict(PREFECTURE_TO_REGION))
+SPOT_COORDS = MappingProxyType(dict(SPOT_COORDS))
+CATEGORY_KEYWORDS = MappingProxyType(dict(CATEGORY_KEYWORDS))
+AIRPORT_NAME_KEYWORDS = tuple(AIRPORT_NAME_KEYWORDS)
+AIRPORT_LOCATION_KEYWORDS = tuple(AIRPORT_LOCATION_KEYWORDS)
+
+# --- 🔥 多關鍵字比對器 (Aho-Corasick) ---
+class KeywordMatcher:
+    """
+    把所有對照表的關鍵字編進同一個自動機，掃描一次字串就得到每張表的命中結果。
+    同一張表命中多個時，取 dict 順序最前面的那一筆 (與原本 for 迴圈 + break 的結果相同)。
+    """
+    def __init__(self, tables):
+        # tables: {表名: [(priority, keywords, value), ...]}
+        self.tables = list(tables)
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [{}]   # node -> {表名: (priority, value)}
+
+        for table, entries in tables.items():
+            for priority, keywords, value in entries:
+                for keyword in keywords:
+                    if keyword: self._add(keyword, table, priority, value)
+        self._build_links()
+
+    def _add(self, keyword, table, priority, value):
+        node = 0
+        for ch in keyword:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append({})
+            node = nxt
+        best = self._out[node].get(table)
+        if best is None or priority < best[0]:
+            self._out[node][table] = (priority, value)
+
+    def _build_links(self):
+        # BFS 建立 failure link，並把 failure 鏈上的輸出預先合併 (每張表只留最優先的)
+        queue = list(self._goto[0].values())
+        for node in queue:
+            for ch, child in self._goto[node].items():
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(ch, 0)
+                merged = dict(self._out[self._fail[child]])
+                for table, hit in self._out[child].items():
+                    if table not in merged or hit[0] < merged[table][0]:
+                        merged[table] = hit
+                self._out[child] = merged
+                queue.append(child)
+        self._out = [tuple((t, p, v) for t, (p, v) in out.items()) for out in self._out]
+
+    def scan(self, text):
+        """回傳 {表名: 命中值}，沒有命中的表不會出現"""
+        goto, fail, out = self._goto, self._fail, self._out
+        best = {}
+        node = 0
+        for ch in text or "":
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            for table, priority, value in out[node]:
+                hit = best.get(table)
+                if hit is None or priority < hit[0]:
+                    best[table] = (priority, value)
+        return {table: value for table, (_, value) in best.items()}
+
+def _matcher_tables():
+    return {
+        "region": [(i, kws, r) for i, (r, kws) in enumerate(REGION_KEYWORDS.items())],
+        "prefecture": [(i, [place], r) for i, (place, r) in enumerate(PREFECTURE_TO_REGION.items())],
+        "spot": [(i, [spot], spot) for i, spot in enumerate(SPOT_COORDS)],
+        "category": [(i, [k], c) for i, (k, c) in enumerate(CATEGORY_KEYWORDS.items())],
+        "airport_name": [(0, AIRPORT_NAME_KEYWORDS, True)],
+        "airport_location": [(0, AIRPORT_LOCATION_KEYWORDS, True)],
+    }
+
+def _tables_identity():
+    # 表格已凍結，只可能被整個替換：比對物件本身就夠了 (每次呼叫都檢查也很便宜)
+    return (id(REGION_KEYWORDS), id(PREFECTURE_TO_REGION), id(SPOT_COORDS), id(CATEGORY_KEYWORDS),
+            id(AIRPORT_NAME_KEYWORDS), id(AIRPORT_LOCATION_KEYWORDS))
+
+_matcher = None
+_matcher_tables_id = None
+_region_rules_digest = None
+_keyword_tables_digest = None
+
+def rebuild_matcher():
+    global _matcher, _matcher_tables_id, _region_rules_digest, _keyword_tables_digest
+    tables = _matcher_tables()
+    _matcher = KeywordMatcher(tables)
+    _matcher_tables_id = _tables_identity()
+    # 比對器用到的所有表 (爬蟲快取的解析結果依此判斷是否過期)
+    _keyword_tables_digest = hashlib.sha1(json.dumps(
+        {kind: [[i, list(kws), value] for i, kws, value in rows] for kind, rows in tables.items()},
+        ensure_ascii=False).encode("utf-8")).hexdigest()
+    # 地區判斷用到的表 (跨 process 穩定的雜湊，存進商品的 rules_fp)
+    _region_rules_digest = hashlib.sha1(json.dumps(
+        [dict(REGION_KEYWORDS), dict(PREFECTURE_TO_REGION), AIRPORT_NAME_KEYWORDS, AIRPORT_LOCATION_KEYWORDS],
+        ensure_ascii=False).encode("utf-8")).hexdigest()
+    return _matcher
+
+def get_matcher():
+    """取得比對器；對照表被替換時自動重建"""
+    if _matcher is None or _tables_identity() != _matcher_tables_id:
+        return rebuild_matcher()
+    return _matcher
+
+def keyword_tables_digest():
+    """地區 / 景點 / 類別所有關鍵字表的版本"""
+    get_matcher()
+    return _keyword_tables_digest
+
+def region_rules_digest():
+    """地區判斷用到的關鍵字表的版本"""
+    get_matcher()
+    return _region_rules_digest
+
+def rules_fingerprint(item, corrections=None, digest=None):
+    """
+    商品上次被判斷地區時的指紋：輸入 (search_location、名稱)、用到的修正表項目、
+    關鍵字表版本，以及判斷後的地區 / 座標。任何一項改變指紋就不同。
+    批次處理時可先取得一次 region_rules_digest() 傳入 digest。
+    """
+    if corrections is None: corrections = LOCATION_CORRECTIONS
+    if digest is None: digest = region_rules_digest()
+    loc = item.get('search_location', '').strip()
+    entry = corrections.get(loc) if loc else None
+    payload = [
+        loc, item.get('name', ''),
+        [entry['lat'], entry['lng'], entry['region']] if entry else digest,
+        item.get('region'), item.get('lat'), item.get('lng'),
+    ]
+    return hashlib.sha1(json.dumps(payload, ensure_ascii=False).encode("utf-8")).hexdigest()[:16]
+
+def classify_name(name, matcher=None):
+    """一次掃描得到 地區 / 景點 / 類別"""
+    hits = (matcher or get_matcher()).scan(name)
+    return {
+        "region": hits.get("region", "其他"),
+        "spot": hits.get("spot"),
+        "category": hits.get("category", "other"),
+    }
+
+def classify_batch(names):
+    """整份目錄一起分類：只檢查一次對照表，之後每個名稱線性掃描"""
+    matcher = get_matcher()
+    return [classify_name(name, matcher) for name in names]
+
 def get_region_from_address(address):
-    for place, region in PREFECTURE_TO_REGION.items():
-        if place in address: return region
-    return None
+    return get_matcher().scan(address).get("prefecture")
 
 def apply_region_logic(item):
     loc_str = item.get('search_location', '')
@@ -170,21 +340,88 @@ def apply_region_logic(item):
     if loc_str and loc_str in LOCATION_CORRECTIONS:
         return LOCATION_CORRECTIONS[loc_str]['region']
 
+    matcher = get_matcher()
     if loc_str:
-        new_region = get_region_from_address(loc_str)
+        loc_hits = matcher.scan(loc_str)
+        new_region = loc_hits.get("prefecture")
         if not new_region:
-            if "空港" in loc_str or "機場" in loc_str:
+            if loc_hits.get("airport_location"):
                 new_region = "其他"
     
     if not new_region:
-        if "パイロット" in name or "飛行機" in name or "CA" in name:
+        name_hits = matcher.scan(name)
+        if name_hits.get("airport_name"):
             new_region = "其他" 
         else:
-            for r_key, keywords in REGION_KEYWORDS.items():
-                if any(k in name for k in keywords):
-                    new_region = r_key
-                    break
+            new_region = name_hits.get("region")
     
     if not new_region:
         new_region = "其他"
-    return new_region
\ No newline at end of file
+    return new_region
+
+# --- 🔥 固定座標配置 (取代隨機抖動) ---
+SLOTS_PER_ANCHOR = 256                       # 每個錨點的螺旋格數
+GOLDEN_ANGLE = math.pi * (3 - math.sqrt(5))
+
+def _stable_hash(key):
+    return int(hashlib.sha1(key.encode("utf-8")).hexdigest()[:12], 16)
+
+class CoordinatePlacer:
+    """
+    依圖片 key 把商品放在錨點 (景點 / 地區中心) 周圍的螺旋格上。
+    先用 add() 登記整批商品，再用 place_all() 一次配置：格子只由這批有哪些 key 決定，
+    和爬取順序無關 (新商品出現在第 1 頁不會因為先被處理而搶走舊商品的格子)。
+    同一批次內同一錨點的商品不會重疊 (格子被佔用時往外找下一格)。
+    """
+    def __init__(self):
+        self._anchors = {}   # (lat, lng, spread) -> [(雜湊, key, ticket)]
+        self._count = 0
+
+    def add(self, key, lat, lng, spread):
+        """登記一個商品，回傳 ticket (place_all() 結果的索引)"""
+        ticket = self._count
+        self._anchors.setdefault((lat, lng, spread), []).append((_stable_hash(key), key, ticket))
+        self._count += 1
+        return ticket
+
+    def place_all(self):
+        """回傳依 ticket 排列的 [(lat, lng)]"""
+        positions = [None] * self._count
+        for (lat, lng, spread), entries in self._anchors.items():
+            entries.sort()
+            taken = set()
+            slots = {}
+            # 第一輪：每格先給本位就在這格的商品 (雜湊最小者)，
+            # 之後找空格的商品不會再佔走別人的本位
+            for h, key, ticket in entries:
+                home = h % SLOTS_PER_ANCHOR
+                if home not in taken:
+                    taken.add(home)
+                    slots[ticket] = home
+            # 第二輪：其餘商品依雜湊順序找空格 (跳格步長也由 key 決定，避免擠成一串)；
+            # 內圈已滿就往外圈同一個位置找
+            for h, key, ticket in entries:
+                if ticket in slots: continue
+                if len(taken) < SLOTS_PER_ANCHOR:
+                    slot = h % SLOTS_PER_ANCHOR
+                    step = (h // SLOTS_PER_ANCHOR) % (SLOTS_PER_ANCHOR // 2) * 2 + 1   # 奇數步長會走過所有格子
+                    while slot in taken:
+                        slot = (slot + step) % SLOTS_PER_ANCHOR
+                else:
+                    offset = (h // SLOTS_PER_ANCHOR) % SLOTS_PER_ANCHOR
+                    ring = 1
+                    while ring * SLOTS_PER_ANCHOR + offset in taken:
+                        ring += 1
+                    slot = ring * SLOTS_PER_ANCHOR + offset
+                taken.add(slot)
+                slots[ticket] = slot
+            for ticket, slot in slots.items():
+                positions[ticket] = self._position(slot, lat, lng, spread)
+        return positions
+
+    @staticmethod
+    def _position(slot, lat, lng, spread):
+        # Vogel 螺旋：格子大致均勻分布在直徑 spread 的圓內
+        radius = spread / 2 * math.sqrt((slot + 0.5) / SLOTS_PER_ANCHOR)
+        angle = slot * GOLDEN_ANGLE
+        return round(lat + radius * math.sin(angle), 6), round(lng + radius * math.cos(angle), 6)
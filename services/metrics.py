@@ -0,0 +1,183 @@
+import time
+import bisect
+import threading
+import contextlib
+
+# 預設的延遲分桶 (秒)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+SIZE_BUCKETS = (100, 1000, 10000, 100000, 1000000, 10000000, 100000000)
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    pairs += [f'{n}="{v}"' for n, v in extra]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value):
+    if value == float("inf"): return "+Inf"
+    if isinstance(value, float) and value.is_integer(): return str(int(value))
+    return repr(value)
+
+class _Metric:
+    """共用部分：名稱、說明、標籤名稱，以及依標籤值分開的資料"""
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            samples = sorted(self._values.items())
+        for key, value in samples:
+            lines.extend(self._samples(key, value))
+        return lines
+
+    def _samples(self, key, value):
+        yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+class Histogram(_Metric):
+    """累計分桶在輸出時才計算，記錄時只做一次二分搜尋"""
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self, key, value):
+        counts, total, count = value[0][:], value[1], value[2]
+        cumulative = 0
+        for bound, n in zip(self.buckets + (float("inf"),), counts):
+            cumulative += n
+            labels = _format_labels(self.labelnames, key, [("le", _format_value(float(bound)))])
+            yield f"{self.name}_bucket{labels} {cumulative}"
+        labels = _format_labels(self.labelnames, key)
+        yield f"{self.name}_sum{labels} {_format_value(total)}"
+        yield f"{self.name}_count{labels} {count}"
+
+class MetricsRegistry:
+    """所有指標的集合；只有 /metrics 被讀取時才會組出文字"""
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def render(self):
+        """Prometheus text exposition format (0.0.4)"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+registry = MetricsRegistry()
+
+# --- 爬蟲 ---
+CRAWL_FETCH_SECONDS = registry.histogram(
+    "chiikawa_crawl_fetch_seconds", "Latency of a single page request (per attempt)", ("status",))
+CRAWL_PARSE_SECONDS = registry.histogram(
+    "chiikawa_crawl_parse_seconds", "Time to parse one catalog page", ("backend",))
+CRAWL_PAGES = registry.counter(
+    "chiikawa_crawl_pages_total", "Catalog pages processed, by how they were resolved", ("result",))
+CRAWL_SECONDS = registry.histogram(
+    "chiikawa_crawl_seconds", "Total duration of a crawl run", ("mode",))
+
+# --- 更新流程各階段 ---
+REFRESH_STAGE_SECONDS = registry.histogram(
+    "chiikawa_refresh_stage_seconds", "Duration of each refresh stage", ("stage",))
+REFRESH_STAGE_ITEMS = registry.counter(
+    "chiikawa_refresh_stage_items_total", "Items handled by each refresh stage", ("stage",))
+REFRESH_STAGE_RATE = registry.gauge(
+    "chiikawa_refresh_stage_items_per_second", "Throughput of the last run of each refresh stage", ("stage",))
+
+# --- 儲存後端 ---
+BACKEND_SECONDS = registry.histogram(
+    "chiikawa_backend_seconds", "Storage backend read / write latency", ("backend", "operation"))
+BACKEND_ITEMS = registry.histogram(
+    "chiikawa_backend_items", "Items read / written per backend call", ("backend", "operation"), SIZE_BUCKETS)
+BACKEND_WRITTEN = registry.histogram(
+    "chiikawa_backend_written", "Paths (firebase) or rows (sqlite) actually written per save", ("backend",), SIZE_BUCKETS)
+CATALOG_BYTES = registry.gauge(
+    "chiikawa_catalog_bytes", "Size of the serialized catalog", ("encoding",))
+
+# --- HTTP ---
+HTTP_REQUEST_SECONDS = registry.histogram(
+    "chiikawa_http_request_seconds", "Request latency per endpoint", ("endpoint", "method", "status"))
+
+@contextlib.contextmanager
+def stage_timer(stage):
+    """
+    with stage_timer("merge") as stage: ...; stage["items"] = n
+    記錄該階段的耗時、處理筆數與每秒筆數，並把結果留在 stage 裡給呼叫端使用。
+    """
+    stats = {"items": 0}
+    start = time.perf_counter()
+    try:
+        yield stats
+    finally:
+        elapsed = time.perf_counter() - start
+        stats["seconds"] = round(elapsed, 3)
+        REFRESH_STAGE_SECONDS.observe(elapsed, stage=stage)
+        REFRESH_STAGE_ITEMS.inc(stats["items"], stage=stage)
+        if elapsed > 0:
+            REFRESH_STAGE_RATE.set(round(stats["items"] / elapsed, 1), stage=stage)
@@ -0,0 +1,106 @@
+import re
+from html.parser import HTMLParser
+from bs4 import BeautifulSoup
+from services.location import classify_name
+
+# lxml 為選用套件，沒裝的話自動改用 stream 解析器
+try:
+    import lxml.html
+    HAS_LXML = True
+except ImportError:
+    HAS_LXML = False
+
+DOMAIN = "https://www.jp-api.com"
+PARSER_VERSION = 1   # make_item / 解析規則改變時 +1 (爬蟲快取的解析結果會作廢)
+PARSER_BACKENDS = ("lxml", "stream", "bs4")
+DEFAULT_BACKEND = "lxml" if HAS_LXML else "stream"
+
+_CHARSET_RE = re.compile(rb'charset=["\']?([A-Za-z0-9_\-]+)', re.I)
+_LIGHTBOX_XPATH = "//a[contains(concat(' ', normalize-space(@class), ' '), ' lightbox ')]"
+
+# --- 分類：名稱 -> 地區 / 類別 ---
+def make_item(name, src, domain=DOMAIN):
+    img_url = domain + src if src.startswith("/") else src
+
+    # 地區 / 類別一次掃描完成 (services/location.py 的 KeywordMatcher)
+    hits = classify_name(name)
+
+    return {
+        "name": name,
+        "image": img_url,
+        "region": hits["region"],
+        "category": hits["category"]
+    }
+
+def _decode(content):
+    if isinstance(content, str): return content
+    match = _CHARSET_RE.search(content[:2048])
+    if match:
+        try:
+            return content.decode(match.group(1).decode("ascii"))
+        except (LookupError, UnicodeDecodeError):
+            pass
+    return content.decode("utf-8", errors="replace")
+
+# --- 各解析器只負責取出 a.lightbox 的 (title, href, img alt) ---
+def _extract_bs4(content):
+    soup = BeautifulSoup(content, "html.parser")
+    for link in soup.find_all("a", class_="lightbox"):
+        img = link.find("img")
+        yield link.get("title", ""), link.get("href", ""), img.get("alt", "") if img else ""
+
+def _extract_lxml(content):
+    if not content: return
+    doc = lxml.html.document_fromstring(content)
+    for link in doc.xpath(_LIGHTBOX_XPATH):
+        imgs = link.xpath(".//img")
+        yield link.get("title", ""), link.get("href", ""), imgs[0].get("alt", "") if imgs else ""
+
+class _LightboxTokenizer(HTMLParser):
+    """只追蹤 <a class="lightbox"> 與其中第一個 <img>，不建立 DOM 樹"""
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.links = []
+        self._current = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "a":
+            attrs = dict(attrs)
+            if "lightbox" in (attrs.get("class") or "").split():
+                self._current = [attrs.get("title") or "", attrs.get("href") or "", None]
+                self.links.append(self._current)
+            else:
+                self._current = None
+        elif tag == "img" and self._current is not None and self._current[2] is None:
+            self._current[2] = dict(attrs).get("alt") or ""
+
+    def handle_endtag(self, tag):
+        if tag == "a":
+            self._current = None
+
+def _extract_stream(content):
+    tokenizer = _LightboxTokenizer()
+    tokenizer.feed(_decode(content))
+    tokenizer.close()
+    for title, href, alt in tokenizer.links:
+        yield title, href, alt or ""
+
+_EXTRACTORS = {
+    "bs4": _extract_bs4,
+    "lxml": _extract_lxml,
+    "stream": _extract_stream,
+}
+
+def parse_page(content, domain=DOMAIN, backend=None):
+    """解析單頁 HTML -> 商品 dict 列表 (可在 process pool 中執行)"""
+    backend = backend or DEFAULT_BACKEND
+    if backend == "lxml" and not HAS_LXML:
+        backend = "stream"
+    extract = _EXTRACTORS[backend]
+
+    items = []
+    for title, href, alt in extract(content):
+        name = title.strip() or alt.strip()
+        if not name: continue
+        items.append(make_item(name, href, domain))
+    return items
@@ -0,0 +1,185 @@
+from services.database import load_public_db, save_public_db
+from services.crawler import run_crawler
+from services.geocode import build_corrections
+from services.images import image_cache
+from services.storage import item_key
+from services.metrics import stage_timer
+from services.location import apply_region_logic, classify_name, CoordinatePlacer, SPOT_COORDS, REGION_COORDS, LOCATION_CORRECTIONS
+
+FIX_FIELDS = ('region', 'lat', 'lng')
+FINGERPRINT_FIELDS = ('search_location', 'name') + FIX_FIELDS   # rules_fingerprint 用到的商品欄位
+
+def merge_crawled_items(crawled_items, old_items, progress=None, corrections=None):
+    """
+    爬蟲結果 + 舊資料 -> 新的商品列表 (沿用舊的 search_location / 座標，其餘自動定位)
+    corrections: 地點 -> {"lat", "lng", "region"}，預設為 LOCATION_CORRECTIONS
+    """
+    if corrections is None: corrections = LOCATION_CORRECTIONS
+    existing_map = {}
+    if old_items:
+        for i in old_items:
+            key = i.get('image', '').split('/')[-1] or i.get('name')
+            existing_map[key] = i
+    
+    updated_list = []
+    placer = CoordinatePlacer()
+    pending = []   # (商品, ticket)：自動定位的座標等整批登記完再一次配置
+    
+    for idx, c_item in enumerate(crawled_items):
+        final_item = c_item.copy()
+        final_item['id'] = idx + 1
+        
+        key = final_item.get('image', '').split('/')[-1] or final_item['name']
+        has_manual_location = False
+        
+        # 檢查是否有手動修正表對應
+        loc = final_item.get('search_location', '')
+        if not loc and key in existing_map:
+             # 繼承舊資料的 search_location
+             loc = existing_map[key].get('search_location', '')
+             final_item['search_location'] = loc
+
+        if loc and loc in corrections:
+            # 🔥 強制修正：使用對照表 (或地理編碼) 的座標和地區
+            correct = corrections[loc]
+            final_item['lat'] = correct['lat']
+            final_item['lng'] = correct['lng']
+            final_item['region'] = correct['region']
+            has_manual_location = True
+
+        # 如果沒有強制修正，嘗試繼承舊資料
+        if not has_manual_location and key in existing_map:
+            old_item = existing_map[key]
+            if 'search_location' in old_item and old_item['search_location']:
+                final_item['lat'] = old_item['lat']
+                final_item['lng'] = old_item['lng']
+                final_item['search_location'] = old_item['search_location']
+                final_item['region'] = old_item.get('region', final_item['region'])
+                has_manual_location = True
+
+        # 自動定位 (最後手段)
+        if not has_manual_location:
+            final_item['region'] = apply_region_logic(final_item)
+            
+            target_lat = None
+            target_lng = None
+            spread = 0.15 
+            
+            spot_key = classify_name(final_item['name'])['spot']
+            if spot_key:
+                coords = SPOT_COORDS[spot_key]
+                target_lat = coords['lat']
+                target_lng = coords['lng']
+                spread = 0.005
+            
+            if target_lat is None:
+                base_coord = REGION_COORDS.get(final_item['region'], REGION_COORDS["其他"])
+                target_lat = base_coord['lat']
+                target_lng = base_coord['lng']
+
+            # 依圖片 key 固定位置 (不再隨機)，沒變的商品每次更新都得到相同座標
+            pending.append((final_item, placer.add(key, target_lat, target_lng, spread)))
+        
+        if final_item['category'] == 'plush': final_item['emoji'] = "🧸"
+        elif final_item['category'] == 'tag': final_item['emoji'] = "🏷️"
+        elif final_item['category'] == 'socks': final_item['emoji'] = "🧦"
+        else: final_item['emoji'] = "✨"
+        
+        updated_list.append(final_item)
+        if progress: progress(items_merged=len(updated_list))
+
+    positions = placer.place_all()
+    for final_item, ticket in pending:
+        final_item['lat'], final_item['lng'] = positions[ticket]
+
+    # 地區判斷的輸入與結果都沒變：沿用上次 /api/fix_regions 留下的指紋
+    # (規則若有改變，指紋自然對不上，下次修正時仍會重新判斷)
+    for final_item in updated_list:
+        old_item = existing_map.get(final_item.get('image', '').split('/')[-1] or final_item['name'])
+        if old_item and 'rules_fp' in old_item and all(
+                old_item.get(f) == final_item.get(f) for f in FINGERPRINT_FIELDS):
+            final_item['rules_fp'] = old_item['rules_fp']
+    
+    return updated_list
+
+def fix_item_region(item, corrections=None):
+    """依修正表 / 關鍵字重新判斷單一商品的地區 (和座標)，有更新時回傳 True"""
+    if corrections is None: corrections = LOCATION_CORRECTIONS
+    loc = item.get('search_location', '').strip()
+    
+    # 1. 強制修正 (查表，其次是地理編碼結果)
+    if loc and loc in corrections:
+        correct = corrections[loc]
+        # 檢查是否需要更新
+        if (item.get('region') != correct['region'] or 
+            abs(item.get('lat', 0) - correct['lat']) > 0.0001 or 
+            abs(item.get('lng', 0) - correct['lng']) > 0.0001):
+            
+            item['lat'] = correct['lat']
+            item['lng'] = correct['lng']
+            item['region'] = correct['region']
+            return True
+        return False
+
+    # 2. 自動判斷 (舊邏輯)
+    old_region = item.get('region')
+    
+    # 優化：如果已經是有效地區，就跳過
+    if old_region and old_region != "其他":
+        return False
+
+    new_region = apply_region_logic(item)
+    if new_region and new_region != old_region:
+        item['region'] = new_region
+        return True
+    return False
+
+def run_refresh(progress=None, full=None):
+    """
+    完整的更新流程：爬蟲 -> 合併 -> 寫入。
+    full=True 強制完整爬取 (None = 由爬蟲依上次完整爬取的時間自動判斷)。
+    progress(**fields) 會收到 pages_fetched / items_crawled / items_merged / write_status 等進度。
+    """
+    progress = progress or (lambda **fields: None)
+    progress(stage="crawl", write_status="pending")
+    old_items = load_public_db()
+
+    pages = {"pages_fetched": 0, "items_crawled": 0}
+    def on_page(page, count):
+        pages["pages_fetched"] += 1
+        pages["items_crawled"] += count
+        progress(**pages)
+
+    # 各階段的耗時 / 每秒筆數會記到 /metrics，也附在結果的 timings 裡
+    timings = {}
+    with stage_timer("crawl") as timings["crawl"]:
+        crawled_items = run_crawler(full=full, progress=on_page)
+        timings["crawl"]["items"] = len(crawled_items)
+
+    # 修正表沒有的地點，批次查詢座標 (有磁碟快取，每個地點最多查一次)
+    progress(stage="geocode")
+    with stage_timer("geocode") as timings["geocode"]:
+        corrections = build_corrections(old_items or [])
+        timings["geocode"]["items"] = len(corrections) - len(LOCATION_CORRECTIONS)
+    progress(locations_resolved=len(corrections) - len(LOCATION_CORRECTIONS))
+
+    progress(stage="merge", items_total=len(crawled_items))
+    with stage_timer("merge") as timings["merge"]:
+        updated_list = merge_crawled_items(crawled_items, old_items, progress, corrections)
+        timings["merge"]["items"] = len(updated_list)
+
+    progress(stage="write", write_status="writing")
+    with stage_timer("write") as timings["write"]:
+        written = save_public_db(updated_list)
+        timings["write"]["items"] = len(updated_list)
+    progress(write_status="done", written=written)
+
+    # 新出現的商品圖片先下載並產生縮圖 (失敗不影響更新結果)
+    old_keys = {item_key(i) for i in old_items or [] if isinstance(i, dict)}
+    new_keys = [item_key(i) for i in updated_list if item_key(i) not in old_keys]
+    progress(stage="images", images_total=len(new_keys))
+    with stage_timer("images") as timings["images"]:
+        cached = image_cache.warm(new_keys)
+        timings["images"]["items"] = len(new_keys)
+    progress(images_cached=cached)
+    return {"total": len(updated_list), "written": written, "timings": timings}
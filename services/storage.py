@@ -0,0 +1,259 @@
+import os
+import copy
+import json
+import sqlite3
+import threading
+
+FIREBASE_KEY_PATHS = ['/etc/secrets/serviceAccountKey.json', "serviceAccountKey.json"]
+FIREBASE_URL = 'https://chiikawalimitedtoregion-default-rtdb.asia-southeast1.firebasedatabase.app/'
+LOCAL_DB_PATH = os.path.join("cache", "public_items.sqlite3")
+BACKUP_PATH = os.path.join("backup", "chiikawa_public_db_backup.json")
+# 只存在後端、不對外公開的欄位 (fix_regions 用的規則指紋)
+INTERNAL_FIELDS = ('rules_fp',)
+
+def item_key(item):
+    """商品的唯一鍵：圖片檔名 (沒有圖片時用名稱)，與前端 userStatus 的 key 相同"""
+    return (item.get('image') or '').split('/')[-1] or item.get('name', '')
+
+def public_item(item):
+    """去掉內部欄位的商品 (新的 dict)；API、匯出與變動紀錄都只用這個"""
+    if not isinstance(item, dict): return item
+    return {k: v for k, v in item.items() if k not in INTERNAL_FIELDS}
+
+def diff_items(old, new):
+    """
+    比較新舊商品列表，回傳 Firebase 多路徑 update 用的 {路徑: 值}。
+    Firebase 以 index 當 key 儲存列表：改變的欄位寫 "i/欄位"，新增寫 "i"，刪除寫 None。
+    """
+    updates = {}
+    for i in range(min(len(old), len(new))):
+        before, after = old[i], new[i]
+        if before == after: continue
+        if isinstance(before, dict) and isinstance(after, dict):
+            for field, value in after.items():
+                if before.get(field) != value or field not in before:
+                    updates[f"{i}/{field}"] = value
+            for field in before.keys() - after.keys():
+                updates[f"{i}/{field}"] = None
+        else:
+            updates[str(i)] = after
+    for i in range(len(old), len(new)):
+        updates[str(i)] = new[i]
+    for i in range(len(new), len(old)):
+        updates[str(i)] = None
+    return updates
+
+# --- Firebase (線上正式資料) ---
+class FirebaseBackend:
+    name = "firebase"
+
+    def __init__(self, ref=None, meta_ref=None):
+        # ref / meta_ref 可以傳入 firebase_admin.db.Reference 的替身 (測試 / benchmark 用)
+        self._ref = ref
+        self._meta_ref = meta_ref
+        # 最後一次讀取 / 寫入的內容，用來計算差異 (只寫入有變動的欄位)
+        self._snapshot = None
+        # _snapshot 對應的 catalog_version；寫入前版本不同代表其他 worker 寫過，快照已經過期
+        self._snapshot_version = None
+
+    @property
+    def ref(self):
+        if self._ref is None:
+            # 第一次使用時才初始化 Firebase，沒有金鑰也能 import
+            import firebase_admin
+            from firebase_admin import credentials, db
+            if not firebase_admin._apps:
+                key_path = next((p for p in FIREBASE_KEY_PATHS if os.path.exists(p)), FIREBASE_KEY_PATHS[-1])
+                firebase_admin.initialize_app(credentials.Certificate(key_path), {
+                    # 請確認這是您的 Firebase 網址
+                    'databaseURL': FIREBASE_URL
+                })
+            self._ref = db.reference('public_items')
+        return self._ref
+
+    @property
+    def meta_ref(self):
+        if self._meta_ref is None:
+            self.ref  # 確保已初始化
+            from firebase_admin import db
+            self._meta_ref = db.reference('public_meta')
+        return self._meta_ref
+
+    def get_version(self):
+        return self.meta_ref.child('catalog_version').get() or 0
+
+    def next_version(self):
+        """目錄版本 +1 (transaction，多個 worker 同時寫也不會重複)"""
+        version = self.meta_ref.child('catalog_version').transaction(lambda current: (current or 0) + 1)
+        if self._snapshot_version is not None and version == self._snapshot_version + 1:
+            self._snapshot_version = version
+        else:
+            # 上次寫入到現在之間有其他 worker 寫過，下次寫入不能再用快照算差異
+            self._snapshot = self._snapshot_version = None
+        return version
+
+    def load_all(self):
+        # 先讀版本再讀資料：中間有人寫入的話版本只會偏舊，寫入時會改用整份覆寫
+        version = self.get_version()
+        data = self.ref.get()
+        data = data if data else []
+        if isinstance(data, list):
+            # 呼叫端會直接修改 item，所以存一份副本當作差異比較的基準
+            self._snapshot = copy.deepcopy(data)
+            self._snapshot_version = version
+        return data
+
+    def save_all(self, data):
+        """有上次的快照 (而且遠端版本沒變) 時只送出差異，回傳寫入的路徑數"""
+        version = self.get_version()
+        if self._snapshot is not None and version != self._snapshot_version:
+            print("⚠️ catalog_version changed since last load, rewriting the whole catalog")
+            self._snapshot = None
+        if self._snapshot is None:
+            self.ref.set(data)
+            written = len(data)
+        else:
+            updates = diff_items(self._snapshot, data)
+            if len(updates) > len(data):
+                # 幾乎整份都變了 (例如整體位移)，直接覆寫比較省
+                self.ref.set(data)
+                written = len(data)
+            else:
+                if updates: self.ref.update(updates)
+                written = len(updates)
+        self._snapshot = copy.deepcopy(data)
+        self._snapshot_version = version
+        return written
+
+    def write_range(self, offset, items):
+        """分批匯入用：寫入 offset 開始的一段商品"""
+        self.ref.update({str(offset + i): item for i, item in enumerate(items)})
+        if self._snapshot is not None:
+            self._snapshot[offset:offset + len(items)] = copy.deepcopy(items)
+
+    def truncate(self, length):
+        """刪除 index >= length 的商品"""
+        if self._snapshot is not None:
+            old_length = len(self._snapshot)
+        else:
+            keys = self.ref.get(shallow=True) or {}
+            old_length = max((int(k) for k in keys), default=-1) + 1 if isinstance(keys, dict) else len(keys)
+        if old_length > length:
+            self.ref.update({str(i): None for i in range(length, old_length)})
+        if self._snapshot is not None:
+            del self._snapshot[length:]
+
+    def get_by_key(self, key):
+        return next((i for i in self.load_all() if item_key(i) == key), None)
+
+    def query(self, region=None, category=None, limit=None, offset=0):
+        items = [i for i in self.load_all()
+                 if (region is None or i.get('region') == region)
+                 and (category is None or i.get('category') == category)]
+        return items[offset:offset + limit if limit is not None else None]
+
+# --- SQLite (本機離線用，有 region / category / 圖片 key 索引) ---
+class SQLiteBackend:
+    name = "sqlite"
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS items (
+            pos INTEGER PRIMARY KEY,
+            id INTEGER,
+            image_key TEXT,
+            region TEXT,
+            category TEXT,
+            data TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_items_region ON items (region, pos);
+        CREATE INDEX IF NOT EXISTS idx_items_category ON items (category, pos);
+        CREATE INDEX IF NOT EXISTS idx_items_image_key ON items (image_key);
+        CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+    """
+
+    def __init__(self, path=LOCAL_DB_PATH, seed_path=BACKUP_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            if path != ":memory:":
+                self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(self.SCHEMA)
+        if seed_path and os.path.exists(seed_path) and not self.count():
+            with open(seed_path, "r", encoding="utf-8") as f:
+                self.save_all(json.load(f))
+            print(f"📦 Local DB seeded from {seed_path}")
+
+    @staticmethod
+    def _row(pos, item):
+        return (pos, item.get('id'), item_key(item), item.get('region'), item.get('category'),
+                json.dumps(item, ensure_ascii=False, sort_keys=True))
+
+    def _fetch(self, sql, params=()):
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [json.loads(r[0]) for r in rows]
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM items").fetchone()[0]
+
+    def load_all(self):
+        return self._fetch("SELECT data FROM items ORDER BY pos")
+
+    def save_all(self, data):
+        """只改寫內容有變的列，回傳寫入的列數"""
+        new_rows = [self._row(pos, item) for pos, item in enumerate(data)]
+        with self._lock, self._conn:
+            current = dict(self._conn.execute("SELECT pos, data FROM items"))
+            changed = [row for row in new_rows if current.get(row[0]) != row[5]]
+            self._conn.executemany("INSERT OR REPLACE INTO items VALUES (?, ?, ?, ?, ?, ?)", changed)
+            removed = self._conn.execute("DELETE FROM items WHERE pos >= ?", (len(data),)).rowcount
+        return len(changed) + removed
+
+    def write_range(self, offset, items):
+        """分批匯入用：寫入 offset 開始的一段商品"""
+        rows = [self._row(offset + i, item) for i, item in enumerate(items)]
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO items VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+    def truncate(self, length):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM items WHERE pos >= ?", (length,))
+
+    def get_version(self):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = 'catalog_version'").fetchone()
+        return int(row[0]) if row else 0
+
+    def next_version(self):
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = 'catalog_version'").fetchone()
+            version = (int(row[0]) if row else 0) + 1
+            self._conn.execute("INSERT OR REPLACE INTO meta VALUES ('catalog_version', ?)", (str(version),))
+        return version
+
+    def get_by_key(self, key):
+        rows = self._fetch("SELECT data FROM items WHERE image_key = ? ORDER BY pos LIMIT 1", (key,))
+        return rows[0] if rows else None
+
+    def query(self, region=None, category=None, limit=None, offset=0):
+        where, params = [], []
+        if region is not None:
+            where.append("region = ?")
+            params.append(region)
+        if category is not None:
+            where.append("category = ?")
+            params.append(category)
+        sql = "SELECT data FROM items"
+        if where: sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY pos LIMIT ? OFFSET ?"
+        params += [-1 if limit is None else limit, offset]
+        return self._fetch(sql, params)
+
+BACKENDS = {
+    "firebase": FirebaseBackend,
+    "sqlite": SQLiteBackend,
+}
@@ -21,6 +21,9 @@ export function setupUI(appState, AppConfig, storageFunctions, Vue) {
         }
     };
 
+    // 圖片走本機縮圖代理 (/img/<key>?size=list|modal|popup)
+    const thumbUrl = (item, size = 'list') => item.image ? `/img/${item.image.split('/').pop()}?size=${size}` : '';
+
     const mergeData = () => {
         if (!appState.publicItems.value || !Array.isArray(appState.publicItems.value)) {
             appState.items.value = [];
@@ -69,12 +72,18 @@ export function setupUI(appState, AppConfig, storageFunctions, Vue) {
     const autoUpdate = async () => {
         appState.isUpdating.value = true;
         try {
-            const res = await apiCall('/api/refresh', 'POST', appState.items.value);
-            appState.publicItems.value = res.data;
-            mergeData();
-            const totalCount = res.total !== undefined ? res.total : (res.data ? res.data.length : 0);
-            alert(`更新完成！共 ${totalCount} 筆商品。`);
-        } catch (e) { /*...*/ }
+            // 更新在背景執行，輪詢工作狀態直到完成
+            const res = await fetch('/api/refresh', { method: 'POST' }).then(r => r.json());
+            let job = res.job;
+            if (!job) throw new Error(res.message || "無法開始更新");
+            while (job.status === 'queued' || job.status === 'running') {
+                await new Promise(resolve => setTimeout(resolve, 2000));
+                job = (await apiCall(`/api/jobs/${job.id}`)).job;
+            }
+            if (job.status === 'failed') throw new Error(job.error || "更新失敗");
+            await fetchPublicItems();
+            alert(`更新完成！共 ${job.result.total} 筆商品。`);
+        } catch (e) { alert(`更新失敗: ${e.message}`); }
         finally { appState.isUpdating.value = false; }
     };
 
@@ -82,8 +91,11 @@ export function setupUI(appState, AppConfig, storageFunctions, Vue) {
         if (!confirm("確定要修正地區？")) return;
         appState.isUpdating.value = true;
         try {
-            const res = await apiCall('/api/fix_regions', 'POST', appState.items.value);
-            appState.publicItems.value = res.data;
+            const res = await apiCall('/api/fix_regions', 'POST');
+            // 伺服器只回傳有變動的欄位，依 key 套用到本地資料
+            const byKey = {};
+            appState.publicItems.value.forEach(pItem => { byKey[pItem.image ? pItem.image.split('/').pop() : pItem.name] = pItem; });
+            (res.patch || []).forEach(({ key, fields }) => { if (byKey[key]) Object.assign(byKey[key], fields); });
             mergeData();
             alert(`修正完成！更新了 ${res.updated} 筆。`);
         } catch (e) {
@@ -150,13 +162,27 @@ export function setupUI(appState, AppConfig, storageFunctions, Vue) {
         const reader = new FileReader();
         reader.onload = async (e) => {
             try {
-                const jsonContent = JSON.parse(e.target.result);
-                if (!confirm(`匯入 ${jsonContent.length} 筆資料？`)) return;
+                // 原始檔案直接上傳，由伺服器串流解析；先 dry run 檢查格式
+                const isNdjson = file.name.endsWith('.ndjson');
+                const upload = (query) => fetch(`/api/import_public_data${query}`, {
+                    method: 'POST',
+                    headers: { 'Content-Type': isNdjson ? 'application/x-ndjson' : 'application/json' },
+                    body: e.target.result
+                }).then(r => r.json());
+                const check = await upload('?dry_run=1');
+                if (check.status === 'error') throw new Error(check.message);
+                let query = '';
+                if (check.invalid) {
+                    const first = check.errors[0];
+                    if (!confirm(`${check.invalid} 筆資料格式錯誤 (第 ${first.index + 1} 筆: ${first.errors.join(', ')})，略過它們並匯入其餘 ${check.valid} 筆？`)) return;
+                    query = '?skip_invalid=1';
+                } else if (!confirm(`匯入 ${check.total} 筆資料？`)) return;
                 appState.isUpdating.value = true;
-                await apiCall('/api/import_public_data', 'POST', jsonContent);
+                const res = await upload(query);
+                if (res.status === 'error') throw new Error(res.message);
                 await fetchPublicItems();
                 alert("匯入成功！");
-            } catch (err) { /*...*/ }
+            } catch (err) { alert(`匯入失敗: ${err.message}`); }
             finally { appState.isUpdating.value = false; event.target.value = ''; }
         };
         reader.readAsText(file);
@@ -174,7 +200,7 @@ export function setupUI(appState, AppConfig, storageFunctions, Vue) {
         if (!filteredItems.value.length) return;
         const item = filteredItems.value[appState.currentModalIndex.value];
         if (item) {
-            appState.modalImage.value = item.image;
+            appState.modalImage.value = thumbUrl(item, 'modal');
             appState.modalTitle.value = item.name;
             appState.modalSubtitle.value = `${item.region} | ${item.category}`;
             appState.modalItem.value = item;
@@ -264,7 +290,7 @@ export function setupUI(appState, AppConfig, storageFunctions, Vue) {
             let contentHtml = '';
             if (group.items.length === 1) {
                 const item = group.items[0].item;
-                contentHtml = item.image ? `<img src="${item.image}" style="width:26px; height:26px; object-fit:contain; border-radius:50%;">` : `<div style="font-size:18px;">${item.emoji}</div>`;
+                contentHtml = item.image ? `<img src="${thumbUrl(item, 'popup')}" style="width:26px; height:26px; object-fit:contain; border-radius:50%;">` : `<div style="font-size:18px;">${item.emoji}</div>`;
             } else {
                 contentHtml = `<div style="font-size:14px; font-weight:bold; color:white;">${group.items.length}</div>`;
             }
@@ -289,7 +315,7 @@ export function setupUI(appState, AppConfig, storageFunctions, Vue) {
                 const btnColor = isOwned ? '#eee' : '#ffb7ce';
                 const btnText = isOwned ? '#888' : 'white';
                 const btnLabel = isOwned ? '取消' : '收藏';
-                const imgTag = item.image ? `<img src="${item.image}" class="map-list-img">` : `<span style="font-size:20px; display:inline-block; width:40px; text-align:center;">${item.emoji}</span>`;
+                const imgTag = item.image ? `<img src="${thumbUrl(item, 'popup')}" class="map-list-img">` : `<span style="font-size:20px; display:inline-block; width:40px; text-align:center;">${item.emoji}</span>`;
 
                 // 產生唯一的 ID 用於綁定點擊事件
                 const imgBtnId = `map-item-img-${item.id}-${group.lat.toFixed(5)}`;
@@ -351,7 +377,7 @@ export function setupUI(appState, AppConfig, storageFunctions, Vue) {
     };
 
     return {
-        fetchPublicItems, mergeData, filteredItems, ownedCount, progressPercentage,
+        fetchPublicItems, mergeData, thumbUrl, filteredItems, ownedCount, progressPercentage,
         toggleOwn, autoUpdate, fixRegions, deletePublicData, resetSelections,
         exportUserData, exportPublicData, downloadJson,
         openImage, closeModal, toggleModalItem, nextImage, prevImage,
@@ -0,0 +1,127 @@
+import asyncio
+import threading
+from types import MappingProxyType
+from http.server import HTTPServer, BaseHTTPRequestHandler
+
+import pytest
+
+from services import location
+from services.crawler import (crawl_async, run_crawler, load_crawl_state, save_crawl_state, CrawlError,
+                              FULL_CRAWL_MAX_AGE)
+
+PAGES = 6
+PER_PAGE = 3
+
+def page_html(page, removed=()):
+    links = "".join(
+        f'<a class="lightbox" href="/images/tphoto_{page}_{n}_b.png" title="東京 商品 {page}-{n}"><img alt=""></a>'
+        for n in range(PER_PAGE) if f"tphoto_{page}_{n}_b.png" not in removed
+    )
+    return f'<html><head><meta charset="utf-8"></head><body>{links}</body></html>'.encode("utf-8")
+
+class FixtureSite:
+    """本機的假目錄網站：/PGE1/ ~ /PGE{pages}/，之後回 404；failing 裡的頁碼回 503，removed 裡的圖片不列出"""
+    def __init__(self, pages=PAGES):
+        self.pages = pages
+        self.failing = set()
+        self.removed = set()
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                page = int(self.path.strip("/").replace("PGE", "") or 0)
+                if page in site.failing:
+                    self.send_response(503)
+                    self.end_headers()
+                    return
+                if not 1 <= page <= site.pages:
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                body = page_html(page, site.removed)
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = HTTPServer(("127.0.0.1", 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self.server.server_port}/PGE{{}}/"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+@pytest.fixture
+def site():
+    site = FixtureSite()
+    yield site
+    site.close()
+
+def crawl(site, **kwargs):
+    kwargs.setdefault("rate_limit", 0)
+    kwargs.setdefault("retries", 1)
+    kwargs.setdefault("backoff", 0)
+    kwargs.setdefault("backend", "stream")
+    return asyncio.run(crawl_async(site.base_url, **kwargs))
+
+def test_discovers_all_pages(site):
+    items, state = crawl(site)
+    assert len(items) == PAGES * PER_PAGE
+    assert sorted(state["pages"], key=int) == [str(p) for p in range(1, PAGES + 1)]
+    assert state["catalog"] == items
+
+def test_failed_page_aborts_instead_of_truncating(site):
+    site.failing.add(3)
+    with pytest.raises(CrawlError):
+        crawl(site)
+
+def test_failure_past_the_last_page_is_ignored(site):
+    site.failing.add(PAGES + 2)
+    items, _ = crawl(site)
+    assert len(items) == PAGES * PER_PAGE
+
+def test_failed_crawl_keeps_previous_state(site, tmp_path):
+    state_path = str(tmp_path / "crawl_state.json")
+    assert len(run_crawler(base_url=site.base_url, state_path=state_path)) == PAGES * PER_PAGE
+    saved = load_crawl_state(state_path)
+
+    site.failing.add(3)
+    with pytest.raises(CrawlError):
+        run_crawler(base_url=site.base_url, state_path=state_path, full=True)
+    assert load_crawl_state(state_path) == saved
+
+    # 網站恢復後的增量爬取仍然拿到完整目錄
+    site.failing.clear()
+    assert len(run_crawler(base_url=site.base_url, state_path=state_path)) == PAGES * PER_PAGE
+
+def test_full_crawl_drops_items_removed_from_later_pages(site, tmp_path):
+    state_path = str(tmp_path / "crawl_state.json")
+    run_crawler(base_url=site.base_url, state_path=state_path)
+    site.removed.add("tphoto_3_1_b.png")
+
+    # 增量爬取在第 1 頁 (全部看過) 就停止，看不到第 3 頁的變化
+    assert len(run_crawler(base_url=site.base_url, state_path=state_path)) == PAGES * PER_PAGE
+    items = run_crawler(base_url=site.base_url, state_path=state_path, full=True)
+    assert len(items) == PAGES * PER_PAGE - 1
+
+def test_stale_state_triggers_full_crawl(site, tmp_path):
+    state_path = str(tmp_path / "crawl_state.json")
+    run_crawler(base_url=site.base_url, state_path=state_path)
+    site.removed.add("tphoto_3_1_b.png")
+    state = load_crawl_state(state_path)
+    state["full_crawl_at"] -= FULL_CRAWL_MAX_AGE + 1
+    save_crawl_state(state, state_path)
+    assert len(run_crawler(base_url=site.base_url, state_path=state_path)) == PAGES * PER_PAGE - 1
+
+def test_keyword_table_change_discards_cached_items(site, tmp_path, monkeypatch):
+    state_path = str(tmp_path / "crawl_state.json")
+    run_crawler(base_url=site.base_url, state_path=state_path)
+    tables = dict(location.CATEGORY_KEYWORDS, 商品="tag")
+    monkeypatch.setattr(location, "CATEGORY_KEYWORDS", MappingProxyType(tables))
+    items = run_crawler(base_url=site.base_url, state_path=state_path)
+    assert {i["category"] for i in items} == {"tag"}
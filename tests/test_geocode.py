@@ -0,0 +1,58 @@
+from types import SimpleNamespace
+
+from services.geocode import GeocodeCache, BatchGeocoder, build_corrections
+from services.location import LOCATION_CORRECTIONS
+
+class FakeGeocoder:
+    """Nominatim 的本機替身：只認得 places 裡的地點，並記錄被查了哪些"""
+    def __init__(self, places):
+        self.places = places
+        self.calls = []
+
+    def geocode(self, query):
+        self.calls.append(query)
+        place = self.places.get(query)
+        if place is None:
+            return None
+        lat, lng, address = place
+        return SimpleNamespace(latitude=lat, longitude=lng, address=address)
+
+PLACES = {
+    "テスト神社": (34.68, 135.52, "テスト神社, 大阪市, 大阪府, 日本"),
+    "テスト温泉": (43.06, 141.35, "テスト温泉, 札幌市, 北海道, 日本"),
+}
+
+def items_at(*locations):
+    return [{"name": f"商品 {n}", "search_location": loc} for n, loc in enumerate(locations)]
+
+def make_geocoder(tmp_path, fake, **kwargs):
+    cache = GeocodeCache(str(tmp_path / "geocode_cache.json"))
+    return BatchGeocoder(fake, cache, min_delay=0, **kwargs)
+
+def test_each_location_is_looked_up_once(tmp_path):
+    fake = FakeGeocoder(PLACES)
+    resolved = make_geocoder(tmp_path, fake).resolve_many(
+        ["テスト神社", " テスト神社 ", "テスト温泉", "どこにもない場所", ""])
+    assert sorted(fake.calls) == sorted(["テスト神社", "テスト温泉", "どこにもない場所"])
+    assert resolved["テスト神社"]["region"] == "近畿"
+    assert resolved["テスト温泉"]["region"] == "北海道"
+    assert "どこにもない場所" not in resolved
+
+def test_results_and_misses_are_cached_on_disk(tmp_path):
+    make_geocoder(tmp_path, FakeGeocoder(PLACES)).resolve_many(["テスト神社", "どこにもない場所"])
+    fake = FakeGeocoder(PLACES)
+    resolved = make_geocoder(tmp_path, fake).resolve_many(["テスト神社", "どこにもない場所"])
+    assert fake.calls == []
+    assert set(resolved) == {"テスト神社"}
+
+def test_manual_corrections_win_and_are_not_looked_up(tmp_path):
+    loc = next(iter(LOCATION_CORRECTIONS))
+    fake = FakeGeocoder({loc: (0.0, 0.0, "somewhere")})
+    corrections = build_corrections(items_at(loc), make_geocoder(tmp_path, fake))
+    assert fake.calls == []
+    assert corrections[loc] == LOCATION_CORRECTIONS[loc]
+
+def test_cache_only_never_calls_the_geocoder(tmp_path):
+    fake = FakeGeocoder(PLACES)
+    resolved = make_geocoder(tmp_path, fake, max_lookups=0).resolve_many(["テスト神社"])
+    assert fake.calls == [] and resolved == {}
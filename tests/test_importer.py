@@ -0,0 +1,21 @@
+import io
+
+import pytest
+
+from services.importer import iter_json_array, ImportFormatError
+
+def parse(text, chunk_size=3):
+    return list(iter_json_array(io.BytesIO(text.encode("utf-8")), chunk_size))
+
+@pytest.mark.parametrize("text, expected", [
+    ("[]", []),
+    ('[1, 2.5, "三", {"a": [1]}]', [1, 2.5, "三", {"a": [1]}]),
+    ("[34.96645498840038]\n", [34.96645498840038]),
+])
+def test_valid_arrays(text, expected):
+    assert parse(text) == expected
+
+@pytest.mark.parametrize("text", ["[1,]", "[1]trailing", "[1] ]", "[,]", "[1 2]", "[1", "{}", ""])
+def test_malformed_uploads_are_rejected(text):
+    with pytest.raises(ImportFormatError):
+        parse(text)
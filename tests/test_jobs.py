@@ -0,0 +1,37 @@
+import threading
+
+from services.jobs import JobRunner
+
+def blocking_job(release):
+    def run(progress):
+        progress(stage="crawl")
+        release.wait(5)
+        return {"total": 1}
+    return run
+
+def test_second_worker_sees_running_job(tmp_path):
+    # 兩個 JobRunner 共用同一個狀態目錄，模擬兩個 gunicorn worker
+    first, second = JobRunner(state_dir=str(tmp_path)), JobRunner(state_dir=str(tmp_path))
+    release = threading.Event()
+    job, created = first.submit("refresh", blocking_job(release))
+    assert created
+
+    other, created = second.submit("refresh", blocking_job(release))
+    assert not created and other.id == job.id
+    assert second.get(job.id).to_dict()["name"] == "refresh"
+
+    release.set()
+    job.wait(5)
+    assert second.get(job.id).to_dict()["result"] == {"total": 1}
+
+def test_lock_is_released_after_job(tmp_path):
+    first, second = JobRunner(state_dir=str(tmp_path)), JobRunner(state_dir=str(tmp_path))
+    job, _ = first.submit("refresh", lambda progress: 1)
+    job.wait(5)
+    job, created = second.submit("refresh", lambda progress: 2)
+    assert created
+    job.wait(5)
+    assert first.get(job.id).status == "succeeded"
+
+def test_unknown_job(tmp_path):
+    assert JobRunner(state_dir=str(tmp_path)).get("missing") is None
@@ -0,0 +1,46 @@
+import random
+from types import MappingProxyType
+
+import pytest
+
+from services import location
+from services.location import CoordinatePlacer
+
+def place(keys, anchor=(35.0, 135.0, 0.15)):
+    placer = CoordinatePlacer()
+    tickets = {key: placer.add(key, *anchor) for key in keys}
+    positions = placer.place_all()
+    return {key: positions[ticket] for key, ticket in tickets.items()}
+
+def test_placement_ignores_crawl_order():
+    keys = [f"tphoto_{n}_b.png" for n in range(600)]   # 超過一圈 (256 格)
+    shuffled = keys[:]
+    random.Random(1).shuffle(shuffled)
+    assert place(keys) == place(shuffled)
+
+def test_no_overlap_within_anchor():
+    positions = place([f"tphoto_{n}_b.png" for n in range(1000)])
+    assert len(set(positions.values())) == 1000
+
+def test_new_item_moves_at_most_a_few_others():
+    keys = [f"tphoto_{n}_b.png" for n in range(100)]
+    before = place(keys)
+    after = place(["tphoto_new_b.png"] + keys)
+    moved = [k for k in keys if before[k] != after[k]]
+    assert len(moved) <= 2
+
+def test_keyword_tables_are_frozen():
+    with pytest.raises(TypeError):
+        location.REGION_KEYWORDS["近畿"] = ("新しい地名",)
+    with pytest.raises(TypeError):
+        location.CATEGORY_KEYWORDS["新しい"] = "tag"
+
+def test_replacing_a_table_rebuilds_the_matcher(monkeypatch):
+    assert location.classify_name("架空の町 ぬいぐるみ")["region"] == "其他"
+    before = location.region_rules_digest()
+    tables = dict(location.REGION_KEYWORDS)
+    tables["近畿"] = tables["近畿"] + ("架空の町",)
+    monkeypatch.setattr(location, "REGION_KEYWORDS", MappingProxyType(tables))
+    assert location.classify_name("架空の町 ぬいぐるみ")["region"] == "近畿"
+    assert location.apply_region_logic({"name": "架空の町 ぬいぐるみ"}) == "近畿"
+    assert location.region_rules_digest() != before
@@ -0,0 +1,155 @@
+import copy
+
+from services.storage import diff_items, public_item, FirebaseBackend
+
+class FakeReference:
+    """firebase_admin.db.Reference 的記憶體替身：列表以 index 為 key 存放，記錄每次 set / update"""
+    def __init__(self, data=None):
+        self.data = {str(i): copy.deepcopy(v) for i, v in enumerate(data or [])}
+        self.calls = []
+
+    def get(self, shallow=False):
+        if not self.data: return None
+        if shallow: return {k: True for k in self.data}
+        size = max(int(k) for k in self.data) + 1
+        return [copy.deepcopy(self.data.get(str(i))) for i in range(size)]
+
+    def set(self, value):
+        self.calls.append(("set", copy.deepcopy(value)))
+        self.data = {str(i): copy.deepcopy(v) for i, v in enumerate(value)}
+
+    def update(self, updates):
+        self.calls.append(("update", copy.deepcopy(updates)))
+        for path, value in updates.items():
+            index, _, field = path.partition("/")
+            if not field:
+                if value is None: self.data.pop(index, None)
+                else: self.data[index] = copy.deepcopy(value)
+            elif value is None:
+                self.data.get(index, {}).pop(field, None)
+            else:
+                self.data.setdefault(index, {})[field] = copy.deepcopy(value)
+
+class FakeValue:
+    """public_meta/<name> 的替身：只支援 get / transaction"""
+    def __init__(self, value=None):
+        self.value = value
+
+    def get(self):
+        return self.value
+
+    def transaction(self, update):
+        self.value = update(self.value)
+        return self.value
+
+class FakeMeta:
+    def __init__(self):
+        self.values = {}
+
+    def child(self, name):
+        return self.values.setdefault(name, FakeValue())
+
+ITEMS = [
+    {"name": "東京 ソックス", "image": "/images/a.png", "region": "關東", "lat": 35.68, "lng": 139.76},
+    {"name": "大阪 ぬいぐるみ", "image": "/images/b.png", "region": "近畿", "lat": 34.69, "lng": 135.50},
+    {"name": "札幌 タグ", "image": "/images/c.png", "region": "北海道", "lat": 43.06, "lng": 141.35},
+]
+
+def test_diff_field_change():
+    new = copy.deepcopy(ITEMS)
+    new[1]["region"] = "其他"
+    assert diff_items(ITEMS, new) == {"1/region": "其他"}
+
+def test_diff_added_field_and_removed_field():
+    new = copy.deepcopy(ITEMS)
+    new[0]["search_location"] = "東京"
+    del new[2]["lng"]
+    assert diff_items(ITEMS, new) == {"0/search_location": "東京", "2/lng": None}
+
+def test_diff_tail_add_and_remove():
+    extra = {"name": "那霸 タグ", "image": "/images/d.png", "region": "沖繩"}
+    assert diff_items(ITEMS, ITEMS + [extra]) == {"3": extra}
+    assert diff_items(ITEMS, ITEMS[:1]) == {"1": None, "2": None}
+
+def test_diff_unchanged_is_empty():
+    assert diff_items(ITEMS, copy.deepcopy(ITEMS)) == {}
+
+def make_backend(items=ITEMS):
+    ref = FakeReference(items)
+    backend = FirebaseBackend(ref=ref, meta_ref=FakeMeta())
+    return backend, ref
+
+def test_save_all_sends_only_changed_fields():
+    backend, ref = make_backend()
+    items = backend.load_all()
+    items[0]["region"] = "其他"
+    del items[1]["lng"]
+    items.append({"name": "那霸 タグ", "image": "/images/d.png", "region": "沖繩"})
+
+    assert backend.save_all(items) == 3
+    assert ref.calls == [("update", {"0/region": "其他", "1/lng": None, "3": items[3]})]
+    assert ref.get() == items
+
+def test_save_all_removes_tail():
+    backend, ref = make_backend()
+    items = backend.load_all()[:2]
+    backend.save_all(items)
+    assert ref.calls == [("update", {"2": None})]
+    assert ref.get() == items
+
+def test_save_all_without_changes_writes_nothing():
+    backend, ref = make_backend()
+    assert backend.save_all(backend.load_all()) == 0
+    assert ref.calls == []
+
+def test_save_all_falls_back_to_set_when_everything_shifted():
+    backend, ref = make_backend()
+    items = backend.load_all()
+    shifted = [{"name": "新 商品", "image": "/images/new.png", "region": "其他"}] + items
+    assert backend.save_all(shifted) == len(shifted)
+    assert [c[0] for c in ref.calls] == ["set"]
+    assert ref.get() == shifted
+
+def test_save_all_without_snapshot_uses_set():
+    backend, ref = make_backend()
+    backend.save_all(ITEMS)
+    assert [c[0] for c in ref.calls] == ["set"]
+
+def test_snapshot_is_not_shared_with_caller():
+    backend, ref = make_backend()
+    items = backend.load_all()
+    backend.save_all(items)
+    items[0]["region"] = "其他"   # 寫入後再改同一個 dict
+    backend.save_all(items)
+    assert ref.calls[-1] == ("update", {"0/region": "其他"})
+
+def test_save_all_after_another_writer_uses_set():
+    backend, ref = make_backend()
+    other = FirebaseBackend(ref=ref, meta_ref=backend.meta_ref)
+    items = backend.load_all()
+
+    # 另一個 worker 在這之間寫入並把版本 +1，本機快照已經過期
+    changed = other.load_all()
+    changed[2]["region"] = "其他"
+    other.save_all(changed)
+    other.next_version()
+
+    items[0]["region"] = "其他"
+    backend.save_all(items)
+    assert [c[0] for c in ref.calls] == ["update", "set"]
+    assert ref.get() == items
+
+def test_own_version_bump_keeps_delta_writes():
+    backend, ref = make_backend()
+    items = backend.load_all()
+    items[0]["region"] = "其他"
+    backend.save_all(items)
+    backend.next_version()
+    items[1]["region"] = "其他"
+    backend.save_all(items)
+    assert ref.calls == [("update", {"0/region": "其他"}), ("update", {"1/region": "其他"})]
+
+def test_public_item_drops_internal_fields():
+    item = dict(ITEMS[0], rules_fp="abc")
+    assert public_item(item) == ITEMS[0]
+    assert item["rules_fp"] == "abc"   # 原本的 dict 不變